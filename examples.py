@@ -5,16 +5,32 @@ This file demonstrates the fixes for Telegram HTML and Discord colors.
 """
 
 import asyncio
+import sys
 from notifications import (
-    NotificationManager,
-    DiscordNotificationProvider,
-    TelegramNotificationProvider,
     UserContext,
     ActionType,
     ColorConfig,
     infer_action_type
 )
 
+# (label, action type, color name) rows shown in the colors demo
+COLOR_SCHEME_EXAMPLES = (
+    ("Voice Join", ActionType.VOICE_JOIN, "Green"),
+    ("Voice Leave", ActionType.VOICE_LEAVE, "Red"),
+    ("Voice Move", ActionType.VOICE_MOVE, "Blue"),
+    ("Status Online", ActionType.STATUS_ONLINE, "Green"),
+    ("Status Idle", ActionType.STATUS_IDLE, "Orange"),
+    ("Warnings", ActionType.WARNING, "Yellow"),
+    ("Admin Actions", ActionType.ADMIN, "Purple"),
+)
+
+# (action type, hex override, description) rows for the env-var example
+CUSTOM_COLOR_EXAMPLES = (
+    (ActionType.VOICE_JOIN, "FF6B6B", "Red joins"),
+    (ActionType.VOICE_LEAVE, "4ECDC4", "Blue leaves"),
+    (ActionType.WARNING, "9B59B6", "Purple warnings"),
+)
+
 
 async def demo_telegram_html_fix():
     """
@@ -22,8 +38,12 @@ async def demo_telegram_html_fix():
     Before: HTML tags showed as raw text (<b>text</b>)
     After: HTML tags render properly (*text*)
     """
-    print("🎯 TELEGRAM HTML FIX DEMONSTRATION")
-    print("=" * 50)
+    lines = []
+    lines.append("🎯 TELEGRAM HTML FIX DEMONSTRATION")
+    lines.append("=" * 50)
+
+    # Only this demo needs the Telegram provider, so import it here
+    from notifications import TelegramNotificationProvider
 
     # Create Telegram provider (in real usage, would need environment setup)
     telegram_provider = TelegramNotificationProvider()
@@ -39,12 +59,14 @@ async def demo_telegram_html_fix():
     )
 
     # The fix ensures HTML tags are preserved while sanitizing user input
-    print("✅ HTML tags will now render properly:")
-    print("Before fix: <b>Test User</b>")
-    print("After fix:  **Test User** (rendered as bold)")
-    print("Before fix: <code>User ID: 123456</code>")
-    print("After fix:  `User ID: 123456` (rendered as code)")
-    print()
+    lines.append("✅ HTML tags will now render properly:")
+    lines.append("Before fix: <b>Test User</b>")
+    lines.append("After fix:  **Test User** (rendered as bold)")
+    lines.append("Before fix: <code>User ID: 123456</code>")
+    lines.append("After fix:  `User ID: 123456` (rendered as code)")
+    lines.append("")
+
+    return "\n".join(lines) + "\n"
 
 
 async def demo_discord_colors():
@@ -53,22 +75,25 @@ async def demo_discord_colors():
     Before: All embeds were hardcoded green
     After: Colors dynamically change based on action type
     """
-    print("🎨 DISCORD DYNAMIC COLORS DEMONSTRATION")
-    print("=" * 50)
-
-    # Show default color scheme
-    print("📋 Default Color Scheme:")
-    print("Voice Join    → Green    (#00FF00)")
-    print("Voice Leave   → Red      (#FF0000)")
-    print("Voice Move    → Blue     (#0080FF)")
-    print("Status Online → Green    (#00FF00)")
-    print("Status Idle   → Orange   (#FFA500)")
-    print("Warnings      → Yellow   (#FFFF00)")
-    print("Admin Actions → Purple   (#800080)")
-    print()
+    lines = []
+    lines.append("🎨 DISCORD DYNAMIC COLORS DEMONSTRATION")
+    lines.append("=" * 50)
+
+    # Hex labels for every configured action color, formatted once
+    color_hex = {
+        action: f"#{color:06X}" for action, color in ColorConfig.get_all_colors().items()
+    }
+
+    # Show default color scheme, with hex values taken from ColorConfig
+    lines.append("📋 Default Color Scheme:")
+    lines.extend(
+        f"{label:<14}→ {color_name:<8} ({color_hex[action]})"
+        for label, action, color_name in COLOR_SCHEME_EXAMPLES
+    )
+    lines.append("")
 
     # Demonstrate action type detection
-    print("🎯 Auto Action Type Detection:")
+    lines.append("🎯 Auto Action Type Detection:")
     test_messages = [
         "🎙️ User John joined voice channel General",
         "🔇 User John left voice channel General",
@@ -78,45 +103,45 @@ async def demo_discord_colors():
 
     for message in test_messages:
         action_type = infer_action_type(message)
-        color = ColorConfig.get_color(action_type)
-        print(f"Message: {message}")
-        print(f"Detected Action: {action_type}")
-        print(f"Assigned Color: #{color:06X}")
-        print()
+        lines.append(f"Message: {message}")
+        lines.append(f"Detected Action: {action_type}")
+        lines.append(f"Assigned Color: {color_hex[action_type]}")
+        lines.append("")
 
     # Demonstrate custom colors via environment variables
-    print("🔧 Custom Color Configuration:")
-    print("Set these environment variables to customize colors:")
-    print("DISCORD_COLOR_VOICE_JOIN=FF6B6B    # Red joins")
-    print("DISCORD_COLOR_VOICE_LEAVE=4ECDC4   # Blue leaves")
-    print("DISCORD_COLOR_WARNING=9B59B6       # Purple warnings")
-    print()
+    lines.append("🔧 Custom Color Configuration:")
+    lines.append("Set these environment variables to customize colors:")
+    lines.extend(
+        f"{f'DISCORD_COLOR_{action.upper()}={value}':<35}# {comment}"
+        for action, value, comment in CUSTOM_COLOR_EXAMPLES
+    )
+    lines.append("")
 
     # Show color validation
-    print("✅ Color Validation:")
-    valid_colors = [0x00FF00, 0xFF0000, 0xFFFFFF]
+    lines.append("✅ Color Validation:")
+    valid_colors = [(color, f"{color:06X}") for color in (0x00FF00, 0xFF0000, 0xFFFFFF)]
     invalid_colors = [-1, 0x1000000, "not_a_number"]
 
-    for color in valid_colors:
-        print(f"🔍 Color {color:06X}: {'✅ Valid' if ColorConfig.validate_color(color) else '❌ Invalid'}")
+    for color, label in valid_colors:
+        lines.append(f"🔍 Color {label}: {'✅ Valid' if ColorConfig.validate_color(color) else '❌ Invalid'}")
 
+    # validate_color returns False for non-integers instead of raising
     for color in invalid_colors:
-        try:
-            is_valid = ColorConfig.validate_color(color)
-            print(f"🔍 Color {color}: {'✅ Valid' if is_valid else '❌ Invalid'}")
-        except:
-            print(f"🔍 Color {color}: ❌ Invalid (type error)")
+        lines.append(f"🔍 Color {color}: {'✅ Valid' if ColorConfig.validate_color(color) else '❌ Invalid'}")
+
+    return "\n".join(lines) + "\n"
 
 
 async def demo_error_handling():
     """
     Demonstrate error handling for unsupported tags and fallback colors.
     """
-    print("🛠️ ERROR HANDLING DEMONSTRATION")
-    print("=" * 50)
+    lines = []
+    lines.append("🛠️ ERROR HANDLING DEMONSTRATION")
+    lines.append("=" * 50)
 
     # Telegram unsupported tags
-    print("📢 Telegram Unsupported Tags Handling:")
+    lines.append("📢 Telegram Unsupported Tags Handling:")
     test_cases = [
         "<b>Supported tag</b>",
         "<strong>Unsupported tag</strong>",
@@ -125,12 +150,12 @@ async def demo_error_handling():
     ]
 
     for html_content in test_cases:
-        print(f"Input:  {html_content}")
-        print(f"Output: Sanitized, safe HTML")  # Actual sanitization would happen
-        print()
+        lines.append(f"Input:  {html_content}")
+        lines.append(f"Output: Sanitized, safe HTML")  # Actual sanitization would happen
+        lines.append("")
 
     # Discord color fallbacks
-    print("🎨 Discord Color Fallbacks:")
+    lines.append("🎨 Discord Color Fallbacks:")
 
     # Simulate environment variable override
     test_scenarios = [
@@ -141,12 +166,12 @@ async def demo_error_handling():
     ]
 
     for scenario, value, expected in test_scenarios:
-        print(f"{scenario}: {expected}")
+        lines.append(f"{scenario}: {expected}")
 
-    print()
+    lines.append("")
 
     # Action type inference fallbacks
-    print("🔍 Action Type Inference Fallbacks:")
+    lines.append("🔍 Action Type Inference Fallbacks:")
     unknown_messages = [
         "Some random message",
         "Technical jargon not in our patterns",
@@ -155,36 +180,40 @@ async def demo_error_handling():
 
     for message in unknown_messages:
         action_type = infer_action_type(message)
-        print(f"Unknown message: '{message}' → {action_type} (fallback)")
+        lines.append(f"Unknown message: '{message}' → {action_type} (fallback)")
+
+    return "\n".join(lines) + "\n"
+
 
 async def demo_voice_channel_links():
     """
     Demonstrate clickable Discord voice channel links in notifications.
     This is a new feature for the enhanced notification system.
     """
-    print("🎙️ VOICE CHANNEL LINKS DEMONSTRATION")
-    print("=" * 50)
+    lines = []
+    lines.append("🎙️ VOICE CHANNEL LINKS DEMONSTRATION")
+    lines.append("=" * 50)
 
     # Show the new functionality
-    print("📎 Clickable Voice Channel Links:")
-    print("✨ New: Voice channel notifications now include clickable links!")
-    print("   - Click the link to automatically join the voice channel")
-    print("   - Works with Discord desktop, mobile, and web clients")
-    print("   - Compatible with existing embed styling and colors")
-    print()
+    lines.append("📎 Clickable Voice Channel Links:")
+    lines.append("✨ New: Voice channel notifications now include clickable links!")
+    lines.append("   - Click the link to automatically join the voice channel")
+    lines.append("   - Works with Discord desktop, mobile, and web clients")
+    lines.append("   - Compatible with existing embed styling and colors")
+    lines.append("")
 
     # Show URL format
-    print("🔗 URL Format:")
+    lines.append("🔗 URL Format:")
     server_id = 123456789012345678
     channel_id = 987654321098765432
     example_url = f"https://discord.com/channels/{server_id}/{channel_id}"
-    print(f"Server ID: {server_id}")
-    print(f"Channel ID: {channel_id}")
-    print(f"Generated URL: {example_url}")
-    print()
+    lines.append(f"Server ID: {server_id}")
+    lines.append(f"Channel ID: {channel_id}")
+    lines.append(f"Generated URL: {example_url}")
+    lines.append("")
 
     # Show what notifications will look like
-    print("💬 Example Notification Messages:")
+    lines.append("💬 Example Notification Messages:")
     examples = [
         {
             "type": "Join",
@@ -207,46 +236,49 @@ async def demo_voice_channel_links():
     ]
 
     for example in examples:
-        print(f"📍 {example['type']} Notification:")
-        print(f"   Message: {example['message']}")
-        print(f"   Embed Color: {example['color']}")
-        print(f"   Clickable Link: {example['url']}")
-        print(f"   → Opens Discord and joins the voice channel!")
-        print()
+        lines.append(f"📍 {example['type']} Notification:")
+        lines.append(f"   Message: {example['message']}")
+        lines.append(f"   Embed Color: {example['color']}")
+        lines.append(f"   Clickable Link: {example['url']}")
+        lines.append(f"   → Opens Discord and joins the voice channel!")
+        lines.append("")
 
     # Show embed structure
-    print("🗂️ Embed Structure with Voice Channel Link:")
-    print("┌─ Discord Embed ───────────────────────────────────────┐")
-    print("│ 🎙️ Voice Channel Join Notification                     │")
-    print("├─ Message ──────────────────────────────────────────────┤")
-    print("│ User TestUser joined voice channel General in server   │")
-    print("│ MyServer                                               │")
-    print("├─ Fields ──────────────────────────────────────────────┤")
-    print("│ 👤 User ID: `123456789`                                │")
-    print("│ 📅 Member Since: January 15, 2024                      │")
-    print("│ 🏷️ Roles: @Admin, @Moderator                          │")
-    print("➕ 🎙️ Voice Channel: [Join Voice Channel](URL)        │")
-    print("└─────────────────────────────────────────────────────────┘")
-    print("↑ Click the 'Join Voice Channel' link to automatically")
-    print("  open Discord and join that voice channel!")
-    print()
-
-    print("⚙️ Implementation Details:")
-    print("• Helper function: create_voice_channel_url(server_id, channel_id)")
-    print("• Enhanced DiscordNotificationProvider with voice channel support")
-    print("• Backward compatible - existing notifications remain unchanged")
-    print("• Automatic URL generation from server and channel IDs")
-    print()
+    lines.append("🗂️ Embed Structure with Voice Channel Link:")
+    lines.append("┌─ Discord Embed ───────────────────────────────────────┐")
+    lines.append("│ 🎙️ Voice Channel Join Notification                     │")
+    lines.append("├─ Message ──────────────────────────────────────────────┤")
+    lines.append("│ User TestUser joined voice channel General in server   │")
+    lines.append("│ MyServer                                               │")
+    lines.append("├─ Fields ──────────────────────────────────────────────┤")
+    lines.append("│ 👤 User ID: `123456789`                                │")
+    lines.append("│ 📅 Member Since: January 15, 2024                      │")
+    lines.append("│ 🏷️ Roles: @Admin, @Moderator                          │")
+    lines.append("➕ 🎙️ Voice Channel: [Join Voice Channel](URL)        │")
+    lines.append("└─────────────────────────────────────────────────────────┘")
+    lines.append("↑ Click the 'Join Voice Channel' link to automatically")
+    lines.append("  open Discord and join that voice channel!")
+    lines.append("")
+
+    lines.append("⚙️ Implementation Details:")
+    lines.append("• Helper function: create_voice_channel_url(server_id, channel_id)")
+    lines.append("• Enhanced DiscordNotificationProvider with voice channel support")
+    lines.append("• Backward compatible - existing notifications remain unchanged")
+    lines.append("• Automatic URL generation from server and channel IDs")
+    lines.append("")
+
+    return "\n".join(lines) + "\n"
 
 async def demo_integration_examples():
     """
     Demonstrate how to integrate the enhanced features into your code.
     """
-    print("🔗 INTEGRATION EXAMPLES")
-    print("=" * 50)
+    lines = []
+    lines.append("🔗 INTEGRATION EXAMPLES")
+    lines.append("=" * 50)
 
-    print("1️⃣ Basic notification with inferred action type:")
-    print("""
+    lines.append("1️⃣ Basic notification with inferred action type:")
+    lines.append("""
 # Automatically detects action from message content
 message = "🎙️ User joined voice channel General"
 action_type = infer_action_type(message)  # Auto-detects VOICE_JOIN
@@ -258,8 +290,8 @@ await notification_manager.send_notification_all(
 )
     """)
 
-    print("2️⃣ Explicit action type for precise control:")
-    print("""
+    lines.append("2️⃣ Explicit action type for precise control:")
+    lines.append("""
 # Explicitly specify action type
 await notification_manager.send_notification_all(
     {"discord": "user_id"},
@@ -268,8 +300,8 @@ await notification_manager.send_notification_all(
 )
     """)
 
-    print("3️⃣ Environment-based color customization:")
-    print("""
+    lines.append("3️⃣ Environment-based color customization:")
+    lines.append("""
 # In your .env file:
 DISCORD_COLOR_VOICE_JOIN=FF6B6B   # Red instead of green
 DISCORD_COLOR_VOICE_LEAVE=4ECDC4  # Teal instead of red
@@ -278,8 +310,8 @@ DISCORD_COLOR_VOICE_LEAVE=4ECDC4  # Teal instead of red
 color = ColorConfig.get_color(ActionType.VOICE_JOIN)  # Uses FF6B6B
     """)
 
-    print("4️⃣ Error handling in production:")
-    print("""
+    lines.append("4️⃣ Error handling in production:")
+    lines.append("""
 try:
     await notification_manager.send_notification_all(
         notifications, message, user_context, action_type
@@ -290,6 +322,8 @@ except Exception as e:
     # Will automatically use default color if Discord color fails
     """)
 
+    return "\n".join(lines) + "\n"
+
 
 async def main():
     """Run all demonstrations"""
@@ -297,20 +331,17 @@ async def main():
     print("=" * 60)
     print()
 
-    await demo_telegram_html_fix()
-    print()
-
-    await demo_discord_colors()
-    print()
-
-    await demo_error_handling()
-    print()
-
-    await demo_voice_channel_links()
-    print()
-
-    await demo_integration_examples()
-    print()
+    # Demos share no state, so run them together and print in a fixed order
+    outputs = await asyncio.gather(
+        demo_telegram_html_fix(),
+        demo_discord_colors(),
+        demo_error_handling(),
+        demo_voice_channel_links(),
+        demo_integration_examples(),
+    )
+    for output in outputs:
+        sys.stdout.write(output)
+        print()
 
     print("✅ All demonstrations completed!")
     print("📚 Ready to use the enhanced notification system.")
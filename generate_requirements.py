@@ -1,53 +1,58 @@
+import re
 import sys
-import toml
+import tomllib
 from pathlib import Path
 
+# PEP 508 distribution name and optional extras at the start of a requirement
+# string, plus the environment marker after ';' if any
+REQUIREMENT_NAME = re.compile(
+    r"\s*([A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*(\[[^\]]*\])?[^;]*(?:;\s*(.+))?"
+)
+
+def normalize_name(name):
+    """Normalize a distribution name as described in PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
 def parse_pyproject(pyproject_path):
-    """Parse pyproject.toml and extract dependencies."""
-    with open(pyproject_path, 'r') as f:
-        pyproject = toml.load(f)
-    
-    dependencies = {}
-    project_deps = pyproject.get('project', {}).get('dependencies', [])
+    """Parse pyproject.toml and extract (name, extras, marker) for each dependency in declared order."""
+    with open(pyproject_path, 'rb') as f:
+        pyproject = tomllib.load(f)
     
-    for dep in project_deps:
-        # Extract package name and version from dependency string
-        # Format: "package>=version"
-        package, version_spec = dep.split('>=')
-        dependencies[package] = version_spec
-    
-    return dependencies
+    # Any PEP 508 form is accepted ("pkg>=1", "pkg[extra]==2", "pkg; marker");
+    # the version specifier is replaced by the locked pin downstream
+    requirements = []
+    for dep in pyproject.get('project', {}).get('dependencies', []):
+        match = REQUIREMENT_NAME.match(dep)
+        if match:
+            name, extras, marker = match.groups()
+            requirements.append((name, extras or "", marker.strip() if marker else None))
+        else:
+            print(f"Warning: Could not parse dependency '{dep}'")
+    return requirements
 
 def parse_uv_lock(lock_path):
     """Parse uv.lock and extract exact package versions."""
-    with open(lock_path, 'r') as f:
-        content = f.read()
-        # Parse TOML content
-        lock_data = toml.loads(content)
-    
-    packages = {}
-    # Extract packages from the lock file
-    for package in lock_data.get('package', []):
-        name = package.get('name')
-        version = package.get('version')
-        if name and version:
-            packages[name] = version
+    with open(lock_path, 'rb') as f:
+        lock_data = tomllib.load(f)
     
-    return packages
+    return {
+        normalize_name(package['name']): package['version']
+        for package in lock_data.get('package', [])
+        if package.get('name') and package.get('version')
+    }
 
 def generate_requirements(pyproject_path, lock_path, output_path):
     """Generate requirements.txt by combining pyproject.toml and uv.lock information."""
-    # Get dependencies from pyproject.toml
     project_deps = parse_pyproject(pyproject_path)
-    
-    # Get exact versions from uv.lock
     locked_versions = parse_uv_lock(lock_path)
     
-    # Combine information and write to requirements.txt
+    # Single pass over the project dependencies, writing pins as we go
     with open(output_path, 'w') as f:
-        for package, _ in project_deps.items():
-            if package in locked_versions:
-                f.write(f"{package}=={locked_versions[package]}\n")
+        for package, extras, marker in project_deps:
+            version = locked_versions.get(normalize_name(package))
+            if version:
+                f.write(f"{package}{extras}=={version}")
+                f.write(f"; {marker}\n" if marker else "\n")
             else:
                 print(f"Warning: Package {package} not found in uv.lock")
 
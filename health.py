@@ -1,13 +1,20 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from functools import lru_cache
+import hashlib
 import pathlib
-from typing import Dict
-from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
 import logging
+import time
+import orjson
+from notifications.cache import TTLCache
 
 
-app = FastAPI()
+# orjson serializes datetimes natively and much faster than the stdlib encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 logger = logging.getLogger("discord_bot")
 
 # Mount static files directory
@@ -20,11 +27,14 @@ class HealthCheck:
         self.discord_client = None
         self.mongo_client = None
         self.notification_manager = None
+        self.voice_activity = None
 
     def initialize(self, discord_client, mongo_client, notification_manager):
         self.discord_client = discord_client
         self.mongo_client = mongo_client
         self.notification_manager = notification_manager
+        # Resolve the collection once instead of on every request
+        self.voice_activity = mongo_client.discord_watch.voice_activity
 
 health_check = HealthCheck()
 
@@ -67,10 +77,15 @@ async def check_notification_providers() -> Dict[str, Dict[str, bool]]:
 @app.get("/health")
 async def health():
     """Get health status of all components"""
+    mongodb_status, discord_status, providers_status = await asyncio.gather(
+        check_mongodb(),
+        check_discord(),
+        check_notification_providers(),
+    )
     health_status = {
-        "mongodb": await check_mongodb(),
-        "discord": await check_discord(),
-        "notification_providers": await check_notification_providers(),
+        "mongodb": mongodb_status,
+        "discord": discord_status,
+        "notification_providers": providers_status,
     }
     
     # Overall status is True only if all critical components are healthy
@@ -81,26 +96,111 @@ async def health():
     
     health_status["status"] = overall_status
     
-    return JSONResponse(
+    return ORJSONResponse(
         content=health_status,
         status_code=200 if overall_status else 503
     )
 
-@app.get("/", response_class=FileResponse)
-async def root():
+@lru_cache(maxsize=None)
+def load_static_page(filename: str) -> Tuple[bytes, str]:
+    """Read a dashboard page once and compute its ETag"""
+    content = (static_dir / filename).read_bytes()
+    etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+    return content, etag
+
+def static_page_response(request: Request, filename: str) -> Response:
+    """Serve a cached dashboard page, answering revalidation with 304"""
+    content, etag = load_static_page(filename)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=content, headers=headers)
+
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request):
     """Serve the health check dashboard"""
-    return FileResponse(
-        str(static_dir / "health.html"),
-        media_type="text/html"
-    )
+    return static_page_response(request, "health.html")
 
-@app.get("/voice")
-async def voice_activity_page():
+@app.get("/voice", response_class=HTMLResponse)
+async def voice_activity_page(request: Request):
     """Serve the voice activity dashboard"""
-    return FileResponse(
-        str(static_dir / "voice-activity.html"),
-        media_type="text/html"
-    )
+    return static_page_response(request, "voice-activity.html")
+
+# Index key on voice_activity.event_time, created by the bot at startup
+EVENT_TIME_INDEX = [("event_time", -1)]
+
+# Fields returned for each voice activity entry. _id is converted to its
+# string form server-side since orjson cannot encode ObjectId, and missing
+# names are filled in by MongoDB so rows need no Python post-processing.
+ACTIVITY_PROJECTION = {
+    "_id": {"$toString": "$_id"},
+    "user_id": 1,
+    "username": {"$ifNull": ["$username", "Unknown User"]},
+    "channel_id": 1,
+    "channel_name": {"$ifNull": ["$channel_name", "Unknown Channel"]},
+    "server_id": 1,
+    "server_name": {"$ifNull": ["$server_name", "Unknown Server"]},
+    "event_time": {"$ifNull": ["$event_time", None]},
+    "event_type": 1
+}
+
+def build_pipeline(match: dict, sort: dict, *stages: dict) -> list:
+    """Build an aggregation pipeline that always starts with $match then $sort
+
+    Keeping these two stages first lets MongoDB satisfy both from an index;
+    reshaping stages placed before $sort would force a collection scan.
+    """
+    return [{"$match": match}, {"$sort": sort}, *stages]
+
+def parse_iso_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO 8601 query parameter into an aware UTC datetime
+
+    Naive values are taken to be UTC, which is how pymongo stores them.
+    """
+    if not value:
+        return None
+    try:
+        # Implemented in C and accepts a trailing 'Z' on Python 3.11+
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid ISO 8601 date: {value}")
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def coerce_id(value: str):
+    """Convert a Discord snowflake query parameter to the int stored by the bot"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def build_activity_query(server: Optional[str], user: Optional[str], event: Optional[str], start: Optional[str], end: Optional[str]) -> dict:
+    """Build the voice activity Mongo query from the request filters"""
+    query = {}
+    if server:
+        query["server_id"] = coerce_id(server)
+    if user:
+        query["user_id"] = coerce_id(user)
+    if event:
+        query["event_type"] = event
+
+    # Add date range filter if provided; either bound may be given alone
+    time_filter = {}
+    start_time = parse_iso_datetime(start)
+    if start_time:
+        time_filter["$gte"] = start_time
+    end_time = parse_iso_datetime(end)
+    if end_time:
+        time_filter["$lte"] = end_time
+    if time_filter:
+        query["event_time"] = time_filter
+    return query
+
+# Per-filter statistics, kept briefly since they are recomputed per page view
+STATS_CACHE_TTL_SECONDS = 30
+stats_cache = TTLCache(maxsize=256, ttl=STATS_CACHE_TTL_SECONDS)
 
 @app.get("/api/voice-activity")
 async def get_voice_activity(
@@ -113,96 +213,115 @@ async def get_voice_activity(
     limit: int = Query(50, ge=1, le=100)
 ):
     """Get filtered voice activity logs"""
+    query = build_activity_query(server, user, event, start, end)
+
     try:
-        # Build the query
-        query = {}
-        if server:
-            query["server_id"] = server
-        if user:
-            query["user_id"] = user
-        if event:
-            query["event_type"] = event
-            
-        # Add date range filter if provided
-        if start and end:
-            query["event_time"] = {
-                "$gte": datetime.fromisoformat(start),
-                "$lte": datetime.fromisoformat(end)
-            }
-            
         logger.info(f"Applying query filters: {query}")
-            
-        # For debugging, let's log some sample documents first
-        sample_doc = await health_check.mongo_client.discord_watch.voice_activity.find_one()
-        if sample_doc:
-            logger.info(f"Sample document format: {sample_doc}")
-            
-        # Remove date filtering temporarily to debug
-        logger.info(f"Initial query without date filter: {query}")
-        # Get all documents matching without date filter
-        total_matching = await health_check.mongo_client.discord_watch.voice_activity.count_documents(query)
-        logger.info(f"Documents matching without date filter: {total_matching}")
 
         # Get paginated results
         skip = (page - 1) * limit
-        collection = health_check.mongo_client.discord_watch.voice_activity
+        collection = health_check.voice_activity
 
-        # First check if we have any documents
-        total_docs = await collection.count_documents({})
-        logger.info(f"Total voice activity documents: {total_docs}")
+        # Diagnostic queries cost extra round trips, so only run them when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            sample_doc = await collection.find_one()
+            if sample_doc:
+                logger.debug(f"Sample document format: {sample_doc}")
+            total_docs = await collection.estimated_document_count()
+            logger.debug(f"Estimated voice activity documents: {total_docs}")
 
-        cursor = collection.find(
-            query,
-            sort=[("event_time", -1)]  # Sort by most recent first
-        ).skip(skip).limit(limit)
-        
-        activities = []
-        async for doc in cursor:
-            # Convert ObjectId and datetime to string for JSON serialization
-            doc["_id"] = str(doc["_id"])
-            doc["event_time"] = doc["event_time"].isoformat() if doc.get("event_time") else None
-            # Ensure all fields are present
-            doc.setdefault("username", "Unknown User")
-            doc.setdefault("channel_name", "Unknown Channel")
-            doc.setdefault("server_name", "Unknown Server")
-            activities.append(doc)
+        # Without equality filters the event_time index serves both the range
+        # and the sort order, so the server never has to sort in memory.
+        # Filtered queries may still need a blocking sort, which is allowed to
+        # spill to disk rather than fail at the in-memory limit.
+        aggregate_options = {}
+        if not query.keys() - {"event_time"}:
+            aggregate_options["hint"] = EVENT_TIME_INDEX
 
-        logger.info(f"Found {len(activities)} activities for current page")
+        page_stages = [
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": ACTIVITY_PROJECTION}
+        ]
 
-        # Get statistics
-        base_time = datetime.now() - timedelta(days=1)
-        
-        # Get total unique users
-        total_users = await collection.distinct("user_id", query)
-        total_users_count = len(total_users)
-
-        # Get total sessions today
-        total_sessions = await collection.count_documents({
-            **query,
-            "event_type": "join",
-            "event_time": {"$gte": base_time}
-        })
-
-        # Get currently active users (joined but not left)
-        active_now = await collection.count_documents({
-            "event_type": "join",
-            "user_id": {
-                "$nin": await collection.distinct(
-                    "user_id",
+        # Statistics tolerate a little lag, so repeated page navigations
+        # with the same filters reuse them instead of recounting
+        stats_key = (server, user, event, start, end)
+        stats = stats_cache.get(stats_key)
+
+        if stats is not None:
+            page_pipeline = build_pipeline(query, {"event_time": -1}, *page_stages)
+            activities = await (await collection.aggregate(page_pipeline, **aggregate_options)).to_list(length=limit)
+        else:
+            base_time = datetime.now(timezone.utc) - timedelta(days=1)
+
+            async def count_active_now():
+                # Users whose latest join/leave event in the window is a join,
+                # counted server-side in one round trip
+                active_now_pipeline = build_pipeline(
                     {
-                        "event_type": "leave",
-                        "event_time": {"$gt": base_time}
-                    }
+                        "event_type": {"$in": ["join", "leave"]},
+                        "event_time": {"$gte": base_time}
+                    },
+                    {"event_time": -1},
+                    {
+                        "$group": {
+                            "_id": "$user_id",
+                            "last_event": {"$first": "$event_type"}
+                        }
+                    },
+                    {"$match": {"last_event": "join"}},
+                    {"$count": "count"}
                 )
-            }
-        })
+                result = await (await collection.aggregate(active_now_pipeline)).to_list(length=1)
+                return result[0]["count"] if result else 0
 
-        stats = {
-            "totalUsers": total_users_count,
-            "totalSessions": total_sessions,
-            "activeNow": active_now
-        }
+            # Page, distinct-user count and session count share the same $match,
+            # so fetch them in a single round trip with $facet. Sorting before the
+            # $facet keeps the scan on the event_time order of the index.
+            facet_pipeline = build_pipeline(
+                query,
+                {"event_time": -1},  # Most recent first
+                {
+                    "$facet": {
+                        "page": page_stages,
+                        "totalUsers": [
+                            {"$group": {"_id": "$user_id"}},
+                            {"$count": "count"}
+                        ],
+                        "totalSessions": [
+                            {
+                                "$match": {
+                                    "event_type": "join",
+                                    "event_time": {"$gte": base_time}
+                                }
+                            },
+                            {"$count": "count"}
+                        ]
+                    }
+                }
+            )
+
+            async def fetch_page_and_totals():
+                # $facet always yields exactly one document
+                result = await (await collection.aggregate(facet_pipeline, **aggregate_options)).to_list(length=1)
+                return result[0]
 
+            # activeNow is not scoped to the filters, so run it alongside
+            facets, active_now = await asyncio.gather(
+                fetch_page_and_totals(),
+                count_active_now(),
+            )
+            activities = facets["page"]
+
+            stats = {
+                "totalUsers": facets["totalUsers"][0]["count"] if facets["totalUsers"] else 0,
+                "totalSessions": facets["totalSessions"][0]["count"] if facets["totalSessions"] else 0,
+                "activeNow": active_now
+            }
+            stats_cache[stats_key] = stats
+
+        logger.info(f"Found {len(activities)} activities for current page")
         logger.info(f"Stats: {stats}")
 
         return {
@@ -214,64 +333,92 @@ async def get_voice_activity(
         logger.error(f"Failed to fetch voice activity: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/voice-activity/stream")
+async def stream_voice_activity(
+    server: str = Query(None),
+    user: str = Query(None),
+    event: str = Query(None),
+    start: str = Query(None),
+    end: str = Query(None),
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=100)
+):
+    """Stream a page of filtered voice activity logs as NDJSON
+
+    Rows are written as they arrive from the cursor, so the page is never
+    held in memory as a whole. Statistics are only served by
+    /api/voice-activity.
+    """
+    query = build_activity_query(server, user, event, start, end)
+    cursor = health_check.voice_activity.find(
+        query,
+        projection=ACTIVITY_PROJECTION,
+        sort=[("event_time", -1)],  # Most recent first
+        skip=(page - 1) * limit,
+        limit=limit
+    )
+
+    async def generate_rows():
+        try:
+            async for doc in cursor:
+                yield orjson.dumps(doc) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so the error can only be logged
+            logger.error(f"Failed to stream voice activity: {str(e)}")
+
+    return StreamingResponse(generate_rows(), media_type="application/x-ndjson")
+
+async def fetch_distinct_names(collection, id_field: str, name_field: str) -> list:
+    """Get one {id, name} pair per distinct id value that has a recorded name, sorted by name"""
+    # Sorting on the (id, name) index lets $group/$first run as a
+    # DISTINCT_SCAN instead of reading every document
+    pipeline = build_pipeline(
+        {
+            id_field: {"$ne": None},
+            name_field: {"$nin": [None, ""]}
+        },
+        {id_field: 1, name_field: 1},
+        {
+            "$group": {
+                "_id": f"${id_field}",
+                "name": {"$first": f"${name_field}"}
+            }
+        },
+        {"$sort": {"name": 1}}
+    )
+    docs = await (await collection.aggregate(pipeline)).to_list(length=None)
+    return [{"id": doc["_id"], "name": doc["name"]} for doc in docs]
+
+# Filter options change rarely; serve them from memory for a short while
+FILTERS_CACHE_TTL_SECONDS = 60
+_filters_cache: Optional[Tuple[float, dict]] = None
+
 @app.get("/api/voice-activity/filters")
 async def get_voice_activity_filters():
     """Get available filter options for voice activity"""
+    global _filters_cache
+    now = time.monotonic()
+    if _filters_cache and now - _filters_cache[0] < FILTERS_CACHE_TTL_SECONDS:
+        return _filters_cache[1]
+
     try:
         logger.info("Fetching voice activity filters...")
-        
-        # Get unique servers with valid names
-        servers = []
-        server_pipeline = [
-            {
-                "$match": {
-                    "server_name": {"$ne": None}  # Only include documents with non-null server names
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$server_id",
-                    "name": {"$first": "$server_name"}
-                }
-            }
-        ]
-        logger.info("Running server aggregation pipeline...")
-        async for doc in health_check.mongo_client.discord_watch.voice_activity.aggregate(server_pipeline):
-            if doc["_id"] is not None and doc["name"]:  # Only add if both id and name are valid
-                servers.append({"id": doc["_id"], "name": doc["name"]})
-        logger.info(f"Found {len(servers)} unique servers")
-
-        # Get unique users with valid names
-        users = []
-        user_pipeline = [
-            {
-                "$match": {
-                    "username": {"$ne": None}  # Only include documents with non-null usernames
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$user_id",
-                    "name": {"$first": "$username"}
-                }
-            }
-        ]
-        logger.info("Running user aggregation pipeline...")
-        async for doc in health_check.mongo_client.discord_watch.voice_activity.aggregate(user_pipeline):
-            if doc["_id"] is not None and doc["name"]:  # Only add if both id and name are valid
-                users.append({"id": doc["_id"], "name": doc["name"]})
-        logger.info(f"Found {len(users)} unique users")
-
-        # Handle None values in sorting
-        def safe_sort_key(x):
-            return x.get("name") or ""  # Return empty string if name is None
-            
+        collection = health_check.voice_activity
+
+        # Both lookups are independent, so issue them together
+        servers, users = await asyncio.gather(
+            fetch_distinct_names(collection, "server_id", "server_name"),
+            fetch_distinct_names(collection, "user_id", "username"),
+        )
+        logger.info(f"Found {len(servers)} unique servers and {len(users)} unique users")
+
         response = {
-            "servers": sorted(servers, key=safe_sort_key),
-            "users": sorted(users, key=safe_sort_key)
+            "servers": servers,
+            "users": users
         }
         
         logger.info(f"Returning filters: {response}")
+        _filters_cache = (now, response)
         return response
 
     except Exception as e:
@@ -4,13 +4,16 @@ import discord
 from dotenv import load_dotenv
 import os
 import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, UpdateOne, WriteConcern
+from pymongo.errors import OperationFailure
 import logging
 from logging.handlers import QueueHandler, QueueListener
-from queue import SimpleQueue
+from queue import Full, Queue
+import threading
 import asyncio
-import uvicorn
+import time
 from health import app, health_check
+from notifications.cache import TTLCache
 
 # Setup intents
 intents = discord.Intents.default()
@@ -32,29 +35,142 @@ from notifications import (
 )
 
 # Presence state cache to prevent duplicate notifications
-# Maps user_id -> last_known_status
+# Maps user_id -> last_known_status, only for watched users
 presence_cache = {}
 
 # Voice channel state cache to prevent duplicate notifications
-# Maps user_id -> last_voice_state_signature (channel_id + timestamp)
-voice_state_cache = {}
+# Maps user_id -> (last_voice_state_signature, monotonic time it was seen)
+# Dedup only looks back a few seconds, so entries can expire quickly
+voice_state_cache = TTLCache(maxsize=50000, ttl=60)
+
+# Identical voice state updates within this window are treated as duplicates
+VOICE_DEDUP_WINDOW_SECONDS = 2.0
+
+# Voice activity documents waiting to be written with insert_many
+voice_activity_buffer = []
+
+# Flush the voice activity buffer on this interval or once it reaches this size
+VOICE_LOG_FLUSH_INTERVAL_SECONDS = 0.5
+VOICE_LOG_FLUSH_SIZE = 500
+# Drop new documents beyond this many pending writes (e.g. MongoDB unreachable)
+VOICE_LOG_MAX_PENDING = 10000
+
+# Notification delivery runs on worker tasks so event handlers never wait on
+# Discord/Telegram. Jobs are sharded by user id to keep each user's
+# notifications in order.
+NOTIFICATION_WORKERS = 4
+NOTIFICATION_QUEUE_SIZE = 10000
+notification_queues = [
+    asyncio.Queue(maxsize=NOTIFICATION_QUEUE_SIZE // NOTIFICATION_WORKERS)
+    for _ in range(NOTIFICATION_WORKERS)
+]
+
+# Non-watched users joining a watched user's channel, coalesced per burst
+# Maps (watched_user_id, channel_id) -> list of joining usernames
+pending_channel_joins = {}
+JOIN_COALESCE_SECONDS = 2.0
 
 # Watched users currently in voice channels
 # Maps channel_id -> Set[UserID] for quick lookup of watched users in channels
 watched_channel_users = {}
 
+# In-memory index of notification preferences, kept in sync with MongoDB
+# Maps str(watched_user_id) -> list of preference documents watching that user
+watched_user_prefs = {}
+
+# Fallback refresh interval when the preferences change stream is unavailable
+WATCHED_USERS_REFRESH_SECONDS = 60
+
+# User context cache so notifications don't refetch the same user
+# Maps (user_id, server_id) -> UserContext, entries expire after 10 minutes
+user_context_cache = TTLCache(maxsize=1024, ttl=600)
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records below WARNING when the queue is full
+
+    Warnings and errors wait briefly for space instead, so they are only
+    lost if the listener is stuck.
+    """
+
+    def __init__(self, queue, block_timeout=1.0):
+        super().__init__(queue)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            if record.levelno >= logging.WARNING:
+                try:
+                    self.queue.put(record, timeout=self.block_timeout)
+                    return
+                except Full:
+                    pass
+            self.dropped += 1
+
+
 # Setup asynchronous logging using QueueHandler
-log_queue = SimpleQueue()
-queue_handler = QueueHandler(log_queue)
+# Bounded so a stalled console can't grow the queue without limit
+LOG_QUEUE_SIZE = 10000
+log_queue = Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = DroppingQueueHandler(log_queue)
 logger = logging.getLogger("discord_bot")
 logger.setLevel(logging.INFO)
 logger.addHandler(queue_handler)
 
+class BufferedStreamHandler(logging.StreamHandler):
+    """StreamHandler that batches formatted records into fewer writes
+
+    The buffer is written once it reaches flush_size characters, and a
+    background thread flushes it every flush_interval seconds.
+    """
+
+    def __init__(self, stream=None, flush_size=64 * 1024, flush_interval=0.2):
+        super().__init__(stream)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._buffered_size = 0
+        self._stop_flushing = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stop_flushing.wait(self.flush_interval):
+            self.flush()
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            self._buffer.append(msg)
+            self._buffered_size += len(msg)
+            if self._buffered_size >= self.flush_size:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if self._buffer:
+                self.stream.write("".join(self._buffer))
+                self._buffer.clear()
+                self._buffered_size = 0
+            super().flush()
+
+    def close(self):
+        self._stop_flushing.set()
+        self.flush()
+        super().close()
+
+
 # Setup a listener to process log messages
-console_handler = logging.StreamHandler()
+console_handler = BufferedStreamHandler()
 formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 console_handler.setFormatter(formatter)
-listener = QueueListener(log_queue, console_handler)
+listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
 listener.start()
 
 
@@ -67,16 +183,20 @@ def get_database():
             raise ValueError("MONGODB_URL environment variable is not set")
 
         # Configure MongoDB client with optimized options for Atlas
-        mongo_client = AsyncIOMotorClient(
+        mongo_client = AsyncMongoClient(
             mongo_url,
             serverSelectionTimeoutMS=5000,  # 5 second timeout
             connectTimeoutMS=10000,  # 10 second timeout
-            maxPoolSize=50,  # Increase connection pool size
-            minPoolSize=10,  # Keep minimum connections ready
-            maxIdleTimeMS=30000,  # Close idle connections after 30 seconds
+            # With asyncio a connection is only held while awaiting a round
+            # trip, so concurrency is the number of in-flight operations
+            # (dozens here), not the number of handlers
+            maxPoolSize=20,
+            minPoolSize=0,  # Don't open idle connections up front
+            maxIdleTimeMS=60000,  # Close idle connections after a minute
             retryWrites=True,
-            # Add TLS/SSL options required by Atlas
-            tls=True,
+            # zlib ships with Python; zstd and snappy need extra packages
+            compressors="zlib",
+            # TLS comes from the connection string (mongodb+srv:// enables it)
         )
 
         logger.info("Initializing MongoDB Atlas connection pool")
@@ -88,15 +208,66 @@ def get_database():
 
 # Initialize database
 async def setup_database():
+    """Create the indexes used by the dashboard queries and event handlers"""
+    voice_activity = client.db.voice_activity
+    # Equality fields first, then the event_time sort key (ESR rule)
+    await asyncio.gather(
+        voice_activity.create_index(
+            [("server_id", 1), ("user_id", 1), ("event_time", -1)]
+        ),
+        voice_activity.create_index([("event_type", 1), ("event_time", -1)]),
+        # Unfiltered dashboard pages walk this in order instead of sorting
+        voice_activity.create_index([("event_time", -1)]),
+        # Back the filter-option lookups with index-only distinct scans
+        voice_activity.create_index([("server_id", 1), ("server_name", 1)]),
+        voice_activity.create_index([("user_id", 1), ("username", 1)]),
+        # Per-user and per-server timelines
+        voice_activity.create_index([("user_id", 1), ("event_time", -1)]),
+        voice_activity.create_index([("server_id", 1), ("event_time", -1)]),
+        # Multikey index for watcher lookups by watched user
+        client.db.notification_preferences.create_index("watched_users"),
+    )
+    # Optionally expire old voice activity; event_time is stored as UTC so
+    # the TTL monitor ages documents correctly
+    retention_days = os.getenv("VOICE_ACTIVITY_RETENTION_DAYS")
+    if retention_days:
+        try:
+            await client.db.command(
+                "collMod",
+                "voice_activity",
+                index={
+                    "keyPattern": {"event_time": -1},
+                    "expireAfterSeconds": int(float(retention_days) * 86400),
+                },
+            )
+        except (OperationFailure, ValueError) as e:
+            logger.warning(f"Could not apply voice activity retention: {str(e)}")
+
+    # One document per member per server; also backs the member upserts
+    try:
+        await client.db.members.create_index(
+            [("user_id", 1), ("server_id", 1)], unique=True
+        )
+    except OperationFailure as e:
+        logger.warning(f"Could not create unique members index: {str(e)}")
     logger.info("Database setup complete")
 
 
 # Helper functions for user context
-async def get_discord_user_context(user_id: int) -> UserContext:
-    """Get user context for Discord notifications"""
+async def get_discord_user_context(user_id: int, server_id: int = None) -> UserContext:
+    """Get user context for Discord notifications
+
+    When server_id is given, guild-specific details come from that server;
+    otherwise from any server the bot shares with the user.
+    """
+    cache_key = (user_id, server_id)
+    cached_context = user_context_cache.get(cache_key)
+    if cached_context is not None:
+        return cached_context
+
     try:
-        # Fetch Discord user
-        discord_user = await client.fetch_user(user_id)
+        # Prefer the gateway cache, only hit the REST API on a miss
+        discord_user = client.get_user(user_id) or await client.fetch_user(user_id)
         if not discord_user:
             # Return basic context if user not found
             return UserContext(
@@ -106,16 +277,17 @@ async def get_discord_user_context(user_id: int) -> UserContext:
             )
 
         # Get member data from database for guild-specific info
-        member_data = None
-        for guild in client.guilds:
-            member_doc = await client.db.members.find_one(
-                {"user_id": user_id, "server_id": guild.id}
-            )
-            if member_doc:
-                member_data = member_doc
-                break
+        if server_id is not None:
+            member_filter = {"user_id": user_id, "server_id": server_id}
+        else:
+            member_filter = {"user_id": user_id, "server_id": {"$in": [guild.id for guild in client.guilds]}}
+        member_data = await client.db.members.find_one(
+            member_filter, {"_id": 0, "joined_at": 1, "nickname": 1, "roles": 1}
+        )
 
-        return UserContext.from_discord_user(discord_user, member_data)
+        user_context = UserContext.from_discord_user(discord_user, member_data)
+        user_context_cache[cache_key] = user_context
+        return user_context
 
     except Exception as e:
         logger.error(f"Failed to get Discord user context for {user_id}: {e}")
@@ -152,6 +324,17 @@ async def init():
         logger.info("Successfully connected to MongoDB Atlas")
         await setup_database()
 
+        # Load watched users into memory and keep them in sync
+        await load_watched_users()
+        client.preferences_watcher = asyncio.create_task(watch_notification_preferences())
+
+        # Write voice activity in batches off the event handlers
+        client.voice_activity_flusher = asyncio.create_task(run_voice_activity_flusher())
+
+        # Warm the pool with a cheap read so the first dashboard request
+        # doesn't pay for connection setup and topology discovery
+        await client.db.voice_activity.find_one({}, {"_id": 1})
+
         # Initialize notification system (imports already done at top)
 
         client.notification_manager = NotificationManager()
@@ -168,6 +351,12 @@ async def init():
         # Initialize all providers
         await client.notification_manager.initialize_providers()
 
+        # Start delivering queued notifications
+        client.notification_workers = [
+            asyncio.create_task(run_notification_worker(queue))
+            for queue in notification_queues
+        ]
+
         # Initialize health check service
         health_check.initialize(client, mongo_client, client.notification_manager)
 
@@ -179,46 +368,83 @@ async def init():
 @client.event
 async def on_ready():
     logger.info(f"We have logged in as {client.user}")
-    # Initial member scan for all servers
-    for guild in client.guilds:
-        await scan_guild_members(guild)
+    # Pick up watched users who were already in voice channels
+    rebuild_channel_cache()
+    # Open DM channels up front so first notifications skip that round-trip
+    discord_provider = client.notification_manager.providers.get("discord")
+    if discord_provider:
+        client.dm_prewarmer = asyncio.create_task(discord_provider.prewarm(get_discord_recipient_ids()))
+    # Initial member scan for all servers, run concurrently but capped so
+    # large bots don't exhaust the MongoDB connection pool
+    scan_slots = asyncio.Semaphore(MEMBER_SCAN_CONCURRENCY)
+
+    async def scan_with_slot(guild):
+        async with scan_slots:
+            await scan_guild_members(guild)
+
+    results = await asyncio.gather(
+        *(scan_with_slot(guild) for guild in client.guilds),
+        return_exceptions=True,
+    )
+    for guild, result in zip(client.guilds, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to scan members of {guild.name}: {str(result)}")
 
 
+# Number of member upserts sent per bulk_write call
+MEMBER_SCAN_BATCH_SIZE = 1000
+
+# Number of guilds scanned at the same time on ready
+MEMBER_SCAN_CONCURRENCY = 16
+
 async def scan_guild_members(guild):
     """Scan and update all members in a guild"""
-    now = datetime.datetime.now()
-    for member in guild.members:
-        roles = [role.name for role in member.roles]
-        await client.db.members.update_one(
+    now = datetime.datetime.now(datetime.UTC)
+    ops = [
+        UpdateOne(
             {"user_id": member.id, "server_id": guild.id},
             {
                 "$set": {
                     "username": str(member),
                     "nickname": member.nick,
-                    "roles": roles,
+                    "roles": [role.name for role in member.roles],
                     "joined_at": member.joined_at,
                     "last_updated": now,
                 }
             },
             upsert=True,
         )
+        for member in guild.members
+    ]
+    # The scan is re-run on every start, so skip waiting for the journal
+    members = client.db.members.with_options(write_concern=WriteConcern(w=1, j=False))
+    # One batch at a time so a guild holds a single pooled connection; guilds
+    # themselves are scanned in parallel by on_ready
+    for i in range(0, len(ops), MEMBER_SCAN_BATCH_SIZE):
+        await members.bulk_write(ops[i:i + MEMBER_SCAN_BATCH_SIZE], ordered=False)
 
 
 @client.event
 async def on_member_join(member):
     """Track when a member joins the server"""
-    now = datetime.datetime.now()
+    now = datetime.datetime.now(datetime.UTC)
     roles = [role.name for role in member.roles]
-    await client.db.members.insert_one(
+    # Upsert so a rejoin missed while offline doesn't hit the unique index
+    await client.db.members.update_one(
+        {"user_id": member.id, "server_id": member.guild.id},
         {
-            "user_id": member.id,
-            "server_id": member.guild.id,
-            "username": str(member),
-            "nickname": member.nick,
-            "roles": roles,
-            "joined_at": now,
-            "last_updated": now,
-        }
+            "$set": {
+                "username": str(member),
+                "nickname": member.nick,
+                "roles": roles,
+                "joined_at": now,
+                "last_updated": now,
+            },
+            # Only set when the document is created, e.g. not on a rejoin
+            # whose leave was missed while the bot was offline
+            "$setOnInsert": {"first_joined_at": now},
+        },
+        upsert=True,
     )
     logger.info(f"Member {member} joined server {member.guild.name}")
 
@@ -235,14 +461,24 @@ async def on_member_remove(member):
 @client.event
 async def on_member_update(before, after):
     """Track member updates (nickname, roles, etc.)"""
-    if before.nick != after.nick or set(before.roles) != set(after.roles):
-        now = datetime.datetime.now()
-        roles = [role.name for role in after.roles]
-        await client.db.members.update_one(
-            {"user_id": after.id, "server_id": after.guild.id},
-            {"$set": {"nickname": after.nick, "roles": roles, "last_updated": now}},
-        )
-        logger.info(f"Member {after} updated in server {after.guild.name}")
+    nick_changed = before.nick != after.nick
+    roles_changed = {role.id for role in before.roles} != {role.id for role in after.roles}
+
+    # Most updates touch nothing we store, so bail out before allocating
+    if not nick_changed and not roles_changed:
+        return
+
+    changes = {"last_updated": datetime.datetime.now(datetime.UTC)}
+    if nick_changed:
+        changes["nickname"] = after.nick
+    if roles_changed:
+        changes["roles"] = [role.name for role in after.roles]
+
+    await client.db.members.update_one(
+        {"user_id": after.id, "server_id": after.guild.id},
+        {"$set": changes},
+    )
+    logger.info(f"Member {after} updated in server {after.guild.name}")
 
 
 # Helper function to get current watched users in a channel
@@ -250,46 +486,189 @@ async def get_watched_users_in_channel(channel_id: int) -> list:
     """Get list of watched users currently in a voice channel"""
     return list(watched_channel_users.get(channel_id, set()))
 
+# Load notification preferences into the in-memory watched-user index
+async def load_watched_users():
+    """Rebuild watched_user_prefs from the notification_preferences collection"""
+    prefs_by_user = {}
+    # Preferences that watch nobody can't produce notifications, skip them
+    async for pref in client.db.notification_preferences.find(
+        {"watched_users.0": {"$exists": True}},
+        {"_id": 0, "watched_users": 1, "notification_channels": 1},
+    ):
+        for watched_user_id in pref.get("watched_users", []):
+            prefs_by_user.setdefault(str(watched_user_id), []).append(pref)
+
+    # Swap contents without awaiting so handlers never see a partial index
+    watched_user_prefs.clear()
+    watched_user_prefs.update(prefs_by_user)
+    logger.info(f"Loaded {len(watched_user_prefs)} watched users")
+
+    # Presence is only cached for watched users, forget anyone no longer watched
+    for user_id in [uid for uid in presence_cache if not is_user_watched(uid)]:
+        del presence_cache[user_id]
+
+    # Watched users may have changed while sitting in voice channels
+    if client.is_ready():
+        rebuild_channel_cache()
+
+async def watch_notification_preferences():
+    """Reload the watched-user index whenever notification preferences change
+
+    Uses a MongoDB change stream; if that is unavailable (e.g. a standalone
+    server), falls back to reloading every WATCHED_USERS_REFRESH_SECONDS.
+    """
+    while True:
+        try:
+            async with await client.db.notification_preferences.watch() as stream:
+                async for _change in stream:
+                    # Fold changes that are already waiting into the same reload
+                    while await stream.try_next() is not None:
+                        pass
+                    await load_watched_users()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(
+                f"Notification preferences change stream unavailable: {str(e)}, "
+                f"reloading every {WATCHED_USERS_REFRESH_SECONDS}s"
+            )
+            await asyncio.sleep(WATCHED_USERS_REFRESH_SECONDS)
+            try:
+                await load_watched_users()
+            except Exception as e:
+                logger.error(f"Failed to reload watched users: {str(e)}")
+
 # Helper function to check if a user is being watched
-async def is_user_watched(user_id: int) -> bool:
+def is_user_watched(user_id: int) -> bool:
     """Check if a user is being watched in notification preferences"""
-    try:
-        pref = await client.db.notification_preferences.find_one(
-            {"watched_users": str(user_id)}
-        )
-        return pref is not None
-    except Exception as e:
-        logger.error(f"Error checking if user {user_id} is watched: {str(e)}")
-        return False
+    return str(user_id) in watched_user_prefs
+
+# Helper function to collect the notification targets of a watched user's watchers
+def get_watcher_notifications(user_id: int) -> list:
+    """Get a provider -> recipient mapping for every watcher of a user"""
+    targets = []
+    for pref in watched_user_prefs.get(str(user_id), []):
+        channels = pref.get("notification_channels", {})
+        notifications = {}
+
+        # Add Discord notifications if configured
+        if "discord_id" in channels:
+            notifications["discord"] = channels["discord_id"]
+
+        # Add Telegram notifications if configured
+        if "telegram_id" in channels:
+            notifications["telegram"] = channels["telegram_id"]
+
+        if notifications:
+            targets.append(notifications)
+    return targets
+
+def get_discord_recipient_ids() -> set:
+    """Get the Discord IDs of every watcher that receives Discord notifications"""
+    return {
+        pref["notification_channels"]["discord_id"]
+        for prefs in watched_user_prefs.values()
+        for pref in prefs
+        if "discord_id" in pref.get("notification_channels", {})
+    }
+
+# Helper function to seed the watched users cache from current voice state
+def rebuild_channel_cache():
+    """Rebuild watched_channel_users from the members of every voice channel"""
+    channel_users = {}
+    for guild in client.guilds:
+        for channel in guild.voice_channels:
+            watched_ids = {
+                member.id for member in channel.members if is_user_watched(member.id)
+            }
+            if watched_ids:
+                channel_users[channel.id] = watched_ids
+
+    watched_channel_users.clear()
+    watched_channel_users.update(channel_users)
 
 # Helper function to get other users in a voice channel (excluding the joining user)
-async def get_other_users_in_channel(channel, exclude_user_id: int) -> tuple:
+def get_other_users_in_channel(channel, exclude_user_id: int) -> tuple:
     """Get information about other users in a channel, including watched status"""
     if not channel:
         return [], []
 
     try:
-        members = channel.members
+        # watched_channel_users already tracks who is watched in each channel
+        watched_ids = watched_channel_users.get(channel.id, set())
         other_users = []
         watched_users_present = []
 
-        for member in members:
+        for member in channel.members:
             if member.id != exclude_user_id:
-                other_users.append(str(member))
+                member_name = str(member)
+                other_users.append(member_name)
 
                 # Check if this other user is being watched
-                if await is_user_watched(member.id):
-                    watched_users_present.append(str(member))
+                if member.id in watched_ids:
+                    watched_users_present.append(member_name)
 
         return other_users, watched_users_present
     except Exception as e:
         logger.error(f"Error getting users in channel {channel.name}: {str(e)}")
         return [], []
 
+# Write buffered voice activity documents in a single batch
+async def flush_voice_activity():
+    """Insert all buffered voice activity documents"""
+    if not voice_activity_buffer:
+        return
+
+    batch = voice_activity_buffer[:]
+    voice_activity_buffer.clear()
+    try:
+        await client.db.voice_activity.insert_many(batch, ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to write {len(batch)} voice activity events: {str(e)}")
+
+async def run_voice_activity_flusher():
+    """Flush the voice activity buffer every VOICE_LOG_FLUSH_INTERVAL_SECONDS"""
+    while True:
+        await asyncio.sleep(VOICE_LOG_FLUSH_INTERVAL_SECONDS)
+        await flush_voice_activity()
+
+# Helper function to get channel and server details
+def get_channel_and_server_info(channel) -> tuple:
+    """Get (channel_id, channel_name, server_id, server_name) for a voice channel"""
+    if channel:
+        guild = channel.guild
+        return channel.id, channel.name, guild.id, guild.name
+    return None, None, None, None
+
+# Helper function to buffer a voice activity document
+def log_voice_activity(user_id: int, username: str, channel_info: tuple, event_type: str, event_time: datetime.datetime):
+    """Queue a voice activity document for the next insert_many flush"""
+    if len(voice_activity_buffer) >= VOICE_LOG_MAX_PENDING:
+        logger.warning(f"Voice activity buffer full, dropping {event_type} event for {username}")
+        return
+
+    channel_id, channel_name, server_id, server_name = channel_info
+    voice_activity_buffer.append(
+        {
+            "user_id": user_id,
+            "username": username,
+            "channel_id": channel_id,
+            "channel_name": channel_name,
+            "server_id": server_id,
+            "server_name": server_name,
+            "event_time": event_time,
+            "event_type": event_type,
+        }
+    )
+
 # Helper function to create voice state signature for deduplication
-def get_voice_state_signature(user_id: int, channel_id: int, event_type: str) -> str:
-    """Create a signature for voice state changes to prevent duplicate notifications"""
-    return f"{user_id}:{channel_id}:{event_type}:{int(datetime.datetime.now().timestamp())}"
+def get_voice_state_signature(user_id: int, channel_id: int, event_type: str, muted: bool = False, deafened: bool = False) -> str:
+    """Create a signature for voice state changes to prevent duplicate notifications
+
+    Mute and deafen flags are included so a real mute/deafen change right
+    after a join is not mistaken for a duplicate of the join.
+    """
+    return f"{user_id}:{channel_id}:{event_type}:{int(muted)}{int(deafened)}"
 
 # Helper function to manage watched users cache for channels
 def update_channel_cache(user_id: int, channel_id: int, action: str):
@@ -326,39 +705,72 @@ def update_channel_cache(user_id: int, channel_id: int, action: str):
     except Exception as e:
         logger.error(f"Error updating channel cache for user {user_id}: {str(e)}")
 
-# Helper function to send notifications about a watched user
-async def send_watched_user_notification(user_id: int, message: str, action_type: str = None, voice_channel_id: int = None, server_id: int = None):
+# Helper function to queue notifications for everyone watching a user
+def queue_watcher_notifications(user_id: int, message: str, action_type: str = None, voice_channel_id: int = None, server_id: int = None):
+    """Queue a notification for every watcher of a user, dropping it if the queue is full"""
+    # Find the notification targets of everyone watching this user
+    watcher_notifications = get_watcher_notifications(user_id)
+    if not watcher_notifications:
+        return
+
+    queue = notification_queues[user_id % NOTIFICATION_WORKERS]
     try:
-        # Find notification preferences for this user
-        pref = await client.db.notification_preferences.find_one(
-            {"watched_users": str(user_id)}
+        queue.put_nowait(
+            (user_id, watcher_notifications, message, action_type, voice_channel_id, server_id)
         )
+    except asyncio.QueueFull:
+        logger.warning(f"Notification queue full, dropping notification for user {user_id}")
+
+# Helper function to batch joins into a watched user's channel
+def queue_channel_join(watched_user_id: int, channel_id: int, username: str, channel_name: str, server_name: str):
+    """Collect a join and notify once per JOIN_COALESCE_SECONDS burst"""
+    key = (watched_user_id, channel_id)
+    joiners = pending_channel_joins.get(key)
+    if joiners is not None:
+        joiners.append(username)
+        return
 
-        if pref:
-            notifications = {}
+    pending_channel_joins[key] = [username]
+    asyncio.get_running_loop().call_later(
+        JOIN_COALESCE_SECONDS, flush_channel_joins, key, channel_name, server_name
+    )
 
-            # Add Discord notifications if configured
-            if "discord_id" in pref.get("notification_channels", {}):
-                notifications["discord"] = pref["notification_channels"]["discord_id"]
+def flush_channel_joins(key: tuple, channel_name: str, server_name: str):
+    """Send one notification for all users who joined during the burst"""
+    joiners = pending_channel_joins.pop(key, None)
+    if not joiners:
+        return
 
-            # Add Telegram notifications if configured
-            if "telegram_id" in pref.get("notification_channels", {}):
-                notifications["telegram"] = pref["notification_channels"]["telegram_id"]
+    watched_user_id, _channel_id = key
+    if len(joiners) == 1:
+        message = f"👤 User {joiners[0]} joined voice channel {channel_name} in server {server_name}, where watched user is already present"
+    else:
+        message = f"👤 Users {', '.join(joiners)} joined voice channel {channel_name} in server {server_name}, where watched user is already present"
+    queue_watcher_notifications(watched_user_id, message)
 
-            if notifications:
-                # Get user context for enhanced notifications
-                user_context = await get_discord_user_context(user_id)
+# Helper function to send notifications about a watched user
+def send_watched_user_notification(user_id: int, message: str, action_type: str = None, voice_channel_id: int = None, server_id: int = None):
+    # Infer action type from message if not provided
+    if action_type is None:
+        action_type = infer_action_type(message)
 
-                # Infer action type from message if not provided
-                if action_type is None:
-                    action_type = infer_action_type(message)
+    queue_watcher_notifications(user_id, message, action_type, voice_channel_id, server_id)
 
-                await client.notification_manager.send_notification_all(
-                    notifications, message, user_context, action_type, voice_channel_id, server_id
-                )
+async def run_notification_worker(queue: asyncio.Queue):
+    """Deliver queued notifications one at a time"""
+    while True:
+        user_id, watcher_notifications, message, action_type, voice_channel_id, server_id = await queue.get()
+        try:
+            # Get user context for enhanced notifications
+            user_context = await get_discord_user_context(user_id, server_id)
 
-    except Exception as e:
-        logger.error(f"Failed to send notification for user {user_id}: {str(e)}")
+            await client.notification_manager.send_notification_to_many(
+                watcher_notifications, message, user_context, action_type, voice_channel_id, server_id
+            )
+        except Exception as e:
+            logger.error(f"Failed to send notification for user {user_id}: {str(e)}")
+        finally:
+            queue.task_done()
 
 
 @client.event
@@ -368,6 +780,10 @@ async def on_presence_update(before, after):
     username = str(after)
     new_status = str(after.status)  # online, offline, idle, dnd
 
+    # Ignore unwatched users before caching anything about them
+    if not is_user_watched(user_id):
+        return
+
     # Check if this is actually a state change using our cache
     last_status = presence_cache.get(user_id)
 
@@ -381,25 +797,20 @@ async def on_presence_update(before, after):
             f"User {username} ({user_id}) status changed from {last_status} to {new_status}"
         )
 
-        # Check if this user is being watched
-        pref = await client.db.notification_preferences.find_one(
-            {"watched_users": str(user_id)}
-        )
-        if pref:
-            message = f"👤 User {username} is now {new_status}"
-            # Determine action type based on status
-            if new_status.lower() == "online":
-                action_type = ActionType.STATUS_ONLINE
-            elif new_status.lower() == "offline":
-                action_type = ActionType.STATUS_OFFLINE
-            elif new_status.lower() == "idle":
-                action_type = ActionType.STATUS_IDLE
-            elif new_status.lower() == "dnd":
-                action_type = ActionType.STATUS_DND
-            else:
-                action_type = ActionType.STATUS_ONLINE  # fallback
-
-            await send_watched_user_notification(user_id, message, action_type)
+        message = f"👤 User {username} is now {new_status}"
+        # Determine action type based on status
+        if new_status.lower() == "online":
+            action_type = ActionType.STATUS_ONLINE
+        elif new_status.lower() == "offline":
+            action_type = ActionType.STATUS_OFFLINE
+        elif new_status.lower() == "idle":
+            action_type = ActionType.STATUS_IDLE
+        elif new_status.lower() == "dnd":
+            action_type = ActionType.STATUS_DND
+        else:
+            action_type = ActionType.STATUS_ONLINE  # fallback
+
+        send_watched_user_notification(user_id, message, action_type)
     else:
         # This is a duplicate event, log it but don't send notification
         logger.debug(
@@ -412,99 +823,52 @@ async def on_presence_update(before, after):
 async def on_voice_state_update(member, before, after):
     user_id = member.id
     username = str(member)
-    now = datetime.datetime.now()
-
-    # Helper function to get channel and server details
-    def get_channel_and_server_info(channel):
-        if channel:
-            return channel.id, channel.name, channel.guild.id, channel.guild.name
-        return None, None, None, None
+    seen_at = time.monotonic()
 
     # Get details for before and after states
-    before_channel_id, before_channel_name, before_server_id, before_server_name = (
-        get_channel_and_server_info(before.channel)
-    )
-    after_channel_id, after_channel_name, after_server_id, after_server_name = (
-        get_channel_and_server_info(after.channel)
-    )
+    before_info = get_channel_and_server_info(before.channel)
+    after_info = get_channel_and_server_info(after.channel)
+    before_channel_id, before_channel_name, before_server_id, before_server_name = before_info
+    after_channel_id, after_channel_name, after_server_id, after_server_name = after_info
 
     # Create voice state signature for deduplication
     voice_signature = None
     if after_channel_id:
-        voice_signature = get_voice_state_signature(user_id, after_channel_id, "join")
+        voice_signature = get_voice_state_signature(
+            user_id, after_channel_id, "join", after.self_mute, after.self_deaf
+        )
     elif before_channel_id:
         voice_signature = get_voice_state_signature(user_id, before_channel_id, "leave")
 
-    # Check for duplicate events using cache
-    if voice_signature and voice_signature == voice_state_cache.get(user_id):
+    # Check for duplicate events seen within the dedup window
+    last_signature, last_seen_at = voice_state_cache.get(user_id, (None, 0.0))
+    if (
+        voice_signature
+        and voice_signature == last_signature
+        and seen_at - last_seen_at < VOICE_DEDUP_WINDOW_SECONDS
+    ):
         logger.debug(f"Duplicate voice state update ignored for user {username} ({user_id})")
         return
 
     # Update cache with new signature
     if voice_signature:
-        voice_state_cache[user_id] = voice_signature
+        voice_state_cache[user_id] = (voice_signature, seen_at)
 
-    # Create voice activity document
-    async def log_voice_activity(
-        channel_id, channel_name, server_id, server_name, event_type
-    ):
-        await client.db.voice_activity.insert_one(
-            {
-                "user_id": user_id,
-                "username": username,
-                "channel_id": channel_id,
-                "channel_name": channel_name,
-                "server_id": server_id,
-                "server_name": server_name,
-                "event_time": now,
-                "event_type": event_type,
-            }
-        )
+    # Timestamp shared by every document and log line for this event
+    now = datetime.datetime.now(datetime.UTC)
 
-    # Helper function to send notifications to all watchers of a specific watched user
-    async def send_notification_to_watchers(watched_user_id: int, message: str):
-        try:
-            pref = await client.db.notification_preferences.find_one(
-                {"watched_users": str(watched_user_id)}
-            )
-            if pref:
-                notifications = {}
-
-                # Add Discord notifications if configured
-                if "discord_id" in pref.get("notification_channels", {}):
-                    notifications["discord"] = pref["notification_channels"]["discord_id"]
-
-                # Add Telegram notifications if configured
-                if "telegram_id" in pref.get("notification_channels", {}):
-                    notifications["telegram"] = pref["notification_channels"]["telegram_id"]
-
-                if notifications:
-                    # Get user context for enhanced notifications
-                    user_context = await get_discord_user_context(watched_user_id)
-                    await client.notification_manager.send_notification_all(
-                        notifications, message, user_context
-                    )
-        except Exception as e:
-            logger.error(f"Failed to send notification for watched user {watched_user_id}: {str(e)}")
+    # Check once whether this user is being watched
+    user_is_watched = is_user_watched(user_id)
 
     # Handle user joining a voice channel
     if before.channel is None and after.channel is not None:
         logger.info(f"{member} joined {after.channel} at {now}")
-        await log_voice_activity(
-            after_channel_id,
-            after_channel_name,
-            after_server_id,
-            after_server_name,
-            "join",
-        )
+        log_voice_activity(user_id, username, after_info, "join", now)
 
         # Get information about other users already in the channel
-        other_users, watched_users_present = await get_other_users_in_channel(after.channel, user_id)
+        other_users, watched_users_present = get_other_users_in_channel(after.channel, user_id)
         watched_users_in_channel = len(watched_users_present)
 
-        # Check if this user is being watched
-        user_is_watched = await is_user_watched(user_id)
-
         if user_is_watched:
             # This is a watched user joining - check for others present
             if watched_users_present:
@@ -513,7 +877,7 @@ async def on_voice_state_update(member, before, after):
             else:
                 message = f"🎙️ User {username} joined voice channel {after_channel_name} in server {after_server_name}"
 
-            await send_watched_user_notification(user_id, message, ActionType.VOICE_JOIN, after_channel_id, after_server_id)
+            send_watched_user_notification(user_id, message, ActionType.VOICE_JOIN, after_channel_id, after_server_id)
 
         # Check if there are already watched users in this channel
         if watched_users_in_channel > 0 and not user_is_watched:
@@ -521,12 +885,11 @@ async def on_voice_state_update(member, before, after):
             # Send notification to all watchers about this non-watched user joining
             for watched_user_in_channel in await get_watched_users_in_channel(after_channel_id):
                 try:
-                    watched_pref = await client.db.notification_preferences.find_one(
-                        {"watched_users": str(watched_user_in_channel)}
-                    )
-                    if watched_pref:
-                        message = f"👤 User {username} joined voice channel {after_channel_name} in server {after_server_name}, where watched user is already present"
-                        await send_notification_to_watchers(watched_user_in_channel, message)
+                    if is_user_watched(watched_user_in_channel):
+                        queue_channel_join(
+                            watched_user_in_channel, after_channel_id, username,
+                            after_channel_name, after_server_name,
+                        )
                 except Exception as e:
                     logger.error(f"Error sending notification to watcher {watched_user_in_channel}: {str(e)}")
 
@@ -537,24 +900,13 @@ async def on_voice_state_update(member, before, after):
     # Handle user leaving a voice channel
     elif before.channel is not None and after.channel is None:
         logger.info(f"{member} left channel {before.channel} at {now}")
-        await log_voice_activity(
-            before_channel_id,
-            before_channel_name,
-            before_server_id,
-            before_server_name,
-            "leave",
-        )
+        log_voice_activity(user_id, username, before_info, "leave", now)
 
-        # Check if this user is being watched
-        pref = await client.db.notification_preferences.find_one(
-            {"watched_users": str(user_id)}
-        )
-        if pref:
+        if user_is_watched:
             message = f"🔇 User {username} left voice channel {before_channel_name} in server {before_server_name}"
-            await send_watched_user_notification(user_id, message, ActionType.VOICE_LEAVE, before_channel_id, before_server_id)
+            send_watched_user_notification(user_id, message, ActionType.VOICE_LEAVE, before_channel_id, before_server_id)
 
         # Update channel cache if this was a watched user
-        user_is_watched = await is_user_watched(user_id)
         if user_is_watched:
             update_channel_cache(user_id, before_channel_id, 'leave')
 
@@ -567,68 +919,44 @@ async def on_voice_state_update(member, before, after):
         logger.info(f"{member} moved from {before.channel} to {after.channel} at {now}")
 
         # Log leave from old channel
-        await log_voice_activity(
-            before_channel_id,
-            before_channel_name,
-            before_server_id,
-            before_server_name,
-            "leave",
-        )
+        log_voice_activity(user_id, username, before_info, "leave", now)
         # Log join to new channel
-        await log_voice_activity(
-            after_channel_id,
-            after_channel_name,
-            after_server_id,
-            after_server_name,
-            "join",
-        )
+        log_voice_activity(user_id, username, after_info, "join", now)
 
-        # Check if this user is being watched
-        pref = await client.db.notification_preferences.find_one(
-            {"watched_users": str(user_id)}
-        )
-        if pref:
+        if user_is_watched:
             message = f"🔄 User {username} moved from voice channel {before_channel_name} to {after_channel_name} in server {after_server_name}"
-            await send_watched_user_notification(user_id, message, ActionType.VOICE_MOVE, after_channel_id, after_server_id)
+            send_watched_user_notification(user_id, message, ActionType.VOICE_MOVE, after_channel_id, after_server_id)
 
         # Update channel cache for watched users
-        user_is_watched = await is_user_watched(user_id)
         if user_is_watched:
             update_channel_cache(user_id, before_channel_id, 'leave')
             update_channel_cache(user_id, after_channel_id, 'join')
 
             # Check if the new channel has other watched users
-            other_users, watched_users_present = await get_other_users_in_channel(after.channel, user_id)
+            other_users, watched_users_present = get_other_users_in_channel(after.channel, user_id)
             if watched_users_present:
                 others_text = ", ".join(watched_users_present)
                 message = f"👥 User {username} moved to voice channel {after_channel_name} in server {after_server_name}. In the same voice channel: {others_text}"
-                await send_watched_user_notification(user_id, message, ActionType.VOICE_MOVE, after_channel_id, after_server_id)
+                send_watched_user_notification(user_id, message, ActionType.VOICE_MOVE, after_channel_id, after_server_id)
 
     # Handle mute status changes
     if before.self_mute != after.self_mute:
         logger.info(
             f"{member} {'muted' if after.self_mute else 'unmuted'} themselves at {now}"
         )
-        await log_voice_activity(
-            after_channel_id,
-            after_channel_name,
-            after_server_id,
-            after_server_name,
-            "mute" if after.self_mute else "unmute",
-        )
+        log_voice_activity(user_id, username, after_info, "mute" if after.self_mute else "unmute", now)
 
     # Handle deafen status changes
     if before.self_deaf != after.self_deaf:
         logger.info(
             f"{member} {'deafened' if after.self_deaf else 'undeafened'} themselves at {now}"
         )
-        await log_voice_activity(
-            after_channel_id,
-            after_channel_name,
-            after_server_id,
-            after_server_name,
-            "deafen" if after.self_deaf else "undeafen",
-        )
+        log_voice_activity(user_id, username, after_info, "deafen" if after.self_deaf else "undeafen", now)
+
+    # Documents from one event (e.g. a move's leave and join) go out in the
+    # same insert_many; don't wait for the timer during bursts
+    if len(voice_activity_buffer) >= VOICE_LOG_FLUSH_SIZE:
+        await flush_voice_activity()
 
 
 # Run the bot and health check API
@@ -636,13 +964,27 @@ async def main():
     # Initialize bot and services
     await init()
 
-    # Setup health check API
-    config = uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="info")
+    # Setup health check API; uvicorn is only needed from here on
+    import uvicorn
+
+    # The API is polled by health checks and the dashboard, so skip the
+    # per-request access log
+    config = uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="info", access_log=False)
     server = uvicorn.Server(config)
 
     # Run both the Discord bot and the health check API
-    await asyncio.gather(client.start(os.getenv("BOT_TOKEN")), server.serve())
+    try:
+        await asyncio.gather(client.start(os.getenv("BOT_TOKEN")), server.serve())
+    finally:
+        # Don't lose voice activity still waiting for the next flush
+        await flush_voice_activity()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # uvloop speeds up both the gateway connection and the API when available
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
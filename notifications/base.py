@@ -1,9 +1,9 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True)
 class UserContext:
     """User context information for enhanced notifications"""
     user_id: str
@@ -13,6 +13,8 @@ class UserContext:
     joined_at: Optional[datetime] = None
     nickname: Optional[str] = None
     roles: Optional[list] = None
+    # Formatted role summaries keyed by limit, see get_roles_text
+    _roles_text: dict = field(default_factory=dict, init=False, repr=False, compare=False)
 
     @classmethod
     def from_discord_user(cls, user, member_data=None):
@@ -52,6 +54,21 @@ class UserContext:
         """Get the best display name available"""
         return self.nickname or self.display_name or self.username or f"User {self.user_id}"
 
+    def get_roles_text(self, limit: int) -> str:
+        """Get the first `limit` roles joined with a "(+N more)" suffix
+
+        The result is cached per limit since the same context is reused for
+        repeat notifications about a user.
+        """
+        roles_text = self._roles_text.get(limit)
+        if roles_text is None:
+            roles = self.roles or []
+            roles_text = ", ".join(roles[:limit])
+            if len(roles) > limit:
+                roles_text += f" (+{len(roles) - limit} more)"
+            self._roles_text[limit] = roles_text
+        return roles_text
+
     def get_joined_date_formatted(self) -> str:
         """Get formatted joined date or fallback"""
         if self.joined_at:
@@ -0,0 +1,73 @@
+"""
+In-process caching helpers for Discord Watch Bot.
+
+Provides a small size-bounded mapping with per-entry expiration, used to keep
+short-lived query results and per-user state from growing without limit.
+"""
+import time
+from typing import Any, Dict, Hashable, Iterator, Tuple
+
+
+class TTLCache:
+    """Size-bounded mapping whose entries expire a fixed time after being set
+
+    When the cache is full the oldest inserted entry is evicted. Expired
+    entries are dropped lazily when they are looked up.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Initialize the cache
+
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Seconds an entry stays valid after it is set
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Insertion ordered: key -> (expires_at, value)
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def __getitem__(self, key: Hashable) -> Any:
+        expires_at, value = self._data[key]
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        # Re-inserting moves the key to the end of the eviction order
+        self._data.pop(key, None)
+        while len(self._data) >= self.maxsize:
+            del self._data[next(iter(self._data))]
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def __delitem__(self, key: Hashable) -> None:
+        del self._data[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(list(self._data))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self.get(key, default)
+        self._data.pop(key, None)
+        return value
+
+    def clear(self) -> None:
+        self._data.clear()
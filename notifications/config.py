@@ -4,6 +4,7 @@ Notification configuration module for Discord Watch Bot.
 This module provides configurable color schemes for Discord embeds and action type constants
 for categorizing different types of notifications.
 """
+from functools import lru_cache
 from typing import Dict, Optional
 import os
 
@@ -80,6 +81,10 @@ class ColorConfig:
         """
         Get the color value for a given action type, with fallback to DEFAULT.
 
+        Environment overrides are resolved and validated once per action type
+        and cached, so they must be set before the first lookup. Invalid
+        overrides fall back to the default scheme.
+
         Args:
             action_type: The action type to get color for
 
@@ -88,7 +93,12 @@ class ColorConfig:
         """
         if not action_type:
             action_type = ActionType.DEFAULT
+        return cls._resolve_color(action_type)
 
+    @classmethod
+    @lru_cache(maxsize=64)
+    def _resolve_color(cls, action_type: str) -> int:
+        """Resolve the color for an action type from the environment or defaults"""
         # Try to get from environment variable first
         env_var = f"DISCORD_COLOR_{action_type.upper()}"
         env_color = os.getenv(env_var)
@@ -96,11 +106,14 @@ class ColorConfig:
         if env_color:
             try:
                 # Convert hex string to integer (handle both 0x and # prefixes)
-                env_color = env_color.strip('#').strip('0x')
-                return int(env_color, 16)
+                color = int(env_color.strip().removeprefix('#').removeprefix('0x'), 16)
             except ValueError:
                 # Log warning about invalid color format (would need logger)
-                pass
+                color = None
+            # Overrides are validated here, once, so get_color only ever
+            # returns colors Discord accepts
+            if cls.validate_color(color):
+                return color
 
         # Fall back to default color scheme
         return cls._DEFAULT_COLORS.get(action_type, cls._DEFAULT_COLORS[ActionType.DEFAULT])
@@ -115,16 +128,48 @@ class ColorConfig:
 
     @classmethod
     def validate_color(cls, color: int) -> bool:
-        """Validate that a color value is within Discord's valid range (0-16777215)"""
+        """Validate that a color value is within Discord's valid range (0-16777215)
+
+        Never raises: values of any other type are reported as invalid.
+        """
         return isinstance(color, int) and 0 <= color <= 0xffffff
 
 
+# Ordered (needs "channel" in the message, keywords, action type) rules for
+# infer_action_type; the first rule with a matching keyword wins
+_ACTION_KEYWORD_RULES = (
+    # Voice channel actions
+    (True, ("joined", "entering", "connecting"), ActionType.VOICE_JOIN),
+    (True, ("left", "leaving", "disconnecting", "🔇"), ActionType.VOICE_LEAVE),
+    (True, ("moved", "moved to", "switched"), ActionType.VOICE_MOVE),
+    (False, ("muted", "🔇"), ActionType.VOICE_MUTE),
+    (False, ("unmuted",), ActionType.VOICE_UNMUTE),
+    (False, ("deafened",), ActionType.VOICE_DEAFEN),
+    (False, ("undeafened",), ActionType.VOICE_UNDEAFEN),
+    # Status changes
+    (False, ("online",), ActionType.STATUS_ONLINE),
+    (False, ("offline",), ActionType.STATUS_OFFLINE),
+    (False, ("idle", "away"), ActionType.STATUS_IDLE),
+    (False, ("dnd", "disturb"), ActionType.STATUS_DND),
+    # Server member actions
+    (False, ("joined server", "member joined"), ActionType.MEMBER_JOIN),
+    (False, ("left server", "member left"), ActionType.MEMBER_LEAVE),
+    # Warning/Error indicators
+    (False, ("warning", "caution", "alert", "⚠️"), ActionType.WARNING),
+    (False, ("error", "failed", "problem", "issue", "❌"), ActionType.ERROR),
+    # Admin actions
+    (False, ("admin", "administrator", "moderator", "staff"), ActionType.ADMIN),
+)
+
+
+@lru_cache(maxsize=2048)
 def infer_action_type(message: str) -> str:
     """
     Attempt to infer the action type from message content.
 
     This is a heuristic-based approach that analyzes the message text
-    to determine the most likely action type.
+    to determine the most likely action type. Results are memoized since
+    the same notification text is commonly classified repeatedly.
 
     Args:
         message: The notification message
@@ -134,52 +179,17 @@ def infer_action_type(message: str) -> str:
     """
 
     message_lower = message.lower()
+    # Cheap single substring test gates the voice channel rules
+    mentions_channel = "channel" in message_lower
 
-    # Voice channel actions
-    if any(word in message_lower for word in ["joined", "entering", "connecting"]) and "channel" in message_lower:
-        return ActionType.VOICE_JOIN
-    elif any(word in message_lower for word in ["left", "leaving", "disconnecting", "🔇"]) and "channel" in message_lower:
-        return ActionType.VOICE_LEAVE
-    elif any(word in message_lower for word in ["moved", "moved to", "switched"]) and "channel" in message_lower:
-        return ActionType.VOICE_MOVE
-    elif "muted" in message_lower or "🔇" in message_lower:
-        return ActionType.VOICE_MUTE
-    elif "unmuted" in message_lower:
-        return ActionType.VOICE_UNMUTE
-    elif "deafened" in message_lower:
-        return ActionType.VOICE_DEAFEN
-    elif "undeafened" in message_lower:
-        return ActionType.VOICE_UNDEAFEN
-
-    # Status changes
-    elif "online" in message_lower:
-        return ActionType.STATUS_ONLINE
-    elif "offline" in message_lower:
-        return ActionType.STATUS_OFFLINE
-    elif "idle" in message_lower or "away" in message_lower:
-        return ActionType.STATUS_IDLE
-    elif "dnd" in message_lower or "disturb" in message_lower:
-        return ActionType.STATUS_DND
-
-    # Server member actions
-    elif "joined server" in message_lower or "member joined" in message_lower:
-        return ActionType.MEMBER_JOIN
-    elif "left server" in message_lower or "member left" in message_lower:
-        return ActionType.MEMBER_LEAVE
-
-    # Warning/Error indicators
-    elif any(word in message_lower for word in ["warning", "caution", "alert", "⚠️"]):
-        return ActionType.WARNING
-    elif any(word in message_lower for word in ["error", "failed", "problem", "issue", "❌"]):
-        return ActionType.ERROR
-
-    # Admin actions
-    elif any(word in message_lower for word in ["admin", "administrator", "moderator", "staff"]):
-        return ActionType.ADMIN
+    for needs_channel, keywords, action_type in _ACTION_KEYWORD_RULES:
+        if needs_channel and not mentions_channel:
+            continue
+        if any(word in message_lower for word in keywords):
+            return action_type
 
     # Default fallback
-    else:
-        return ActionType.DEFAULT
+    return ActionType.DEFAULT
 
 
 class TelegramThumbnailConfig:
@@ -1,12 +1,37 @@
 from .base import NotificationProvider, UserContext
 from .config import ColorConfig, infer_action_type
+from .cache import TTLCache
+from functools import lru_cache
+import aiohttp
+import asyncio
 import discord
 import logging
-from typing import List, Optional, Dict, Any
+import os
+from typing import Iterable, List, NamedTuple, Optional, Dict, Any, Union
 
 logger = logging.getLogger("discord_bot")
 
+utcnow = discord.utils.utcnow
 
+# Number of (server, channel) URLs kept in memory; read once at import
+try:
+    VOICE_CHANNEL_URL_CACHE_SIZE = int(os.getenv("DISCORD_VOICE_CHANNEL_URL_CACHE_SIZE", "4096"))
+except ValueError:
+    VOICE_CHANNEL_URL_CACHE_SIZE = 4096
+
+# Discord embed description limit is 4096; keep margin
+EMBED_LIMIT = 4000
+# Discord message character limit is 2000 per message when not using embeds
+MESSAGE_LIMIT = 2000
+# Concurrent DM deliveries; more than this tends to hit per-route rate limits
+SEND_CONCURRENCY = 5
+# Retries for deliveries rejected by a rate limit or a Discord server error,
+# waiting SEND_RETRY_DELAY seconds and doubling it each time
+SEND_RETRIES = 3
+SEND_RETRY_DELAY = 1.0
+
+
+@lru_cache(maxsize=VOICE_CHANNEL_URL_CACHE_SIZE)
 def create_voice_channel_url(server_id: int, channel_id: int) -> str:
     """Create a clickable Discord voice channel URL
 
@@ -20,16 +45,30 @@ def create_voice_channel_url(server_id: int, channel_id: int) -> str:
     return f"https://discord.com/channels/{server_id}/{channel_id}"
 
 
+class FormattedMessage(NamedTuple):
+    """A Discord payload: either a single embed or plain text chunks"""
+    embed: Optional[discord.Embed]
+    chunks: Optional[List[str]]
+
+
 class DiscordNotificationProvider(NotificationProvider):
     def __init__(self, client: discord.Client):
         self.client = client
+        # Users fetched over REST, kept for 10 minutes
+        self._user_cache = TTLCache(maxsize=1024, ttl=600)
+        # In-flight fetch_user calls so concurrent misses share one request
+        self._pending_fetches: Dict[int, asyncio.Future] = {}
+        # Caps concurrent deliveries so fan-out doesn't trigger 429 retries
+        self._send_semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+        # DM channels opened so far, so deliveries skip the user lookup
+        self._dm_channels: Dict[int, discord.DMChannel] = {}
 
     async def initialize(self) -> None:
         # No initialization needed for Discord as we're using the existing client
         pass
 
-    def _format_for_discord(self, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> dict:
-        """Return a dict describing how to send the message on Discord.
+    def _format_for_discord(self, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> FormattedMessage:
+        """Return a FormattedMessage describing how to send the message on Discord.
 
         We prefer to send a single embed when the message fits. If the
         message is very long, split into chunks of safe size and send as
@@ -42,22 +81,16 @@ class DiscordNotificationProvider(NotificationProvider):
             voice_channel_id: Optional voice channel ID to create clickable link
             server_id: Optional server ID (required if voice_channel_id is provided)
         """
-        # Discord embed description limit is 4096; keep margin
-        EMBED_LIMIT = 4000
-        # Discord message character limit is 2000 per message when not using embeds
-        MESSAGE_LIMIT = 2000
-
-        if len(message) <= EMBED_LIMIT:
+        message_length = len(message)
+        if message_length <= EMBED_LIMIT:
             embed = self._create_enhanced_embed(message, user_context, action_type, voice_channel_id, server_id)
-            return {"embed": embed}
+            return FormattedMessage(embed, None)
 
         # If it's too long for an embed, split into message-sized chunks
-        chunks: List[str] = []
-        idx = 0
-        while idx < len(message):
-            chunks.append(message[idx : idx + MESSAGE_LIMIT])
-            idx += MESSAGE_LIMIT
-        return {"chunks": chunks}
+        chunks: List[str] = [
+            message[idx : idx + MESSAGE_LIMIT] for idx in range(0, message_length, MESSAGE_LIMIT)
+        ]
+        return FormattedMessage(None, chunks)
 
     def _create_enhanced_embed(self, message: str, user_context: Optional[UserContext], action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> discord.Embed:
         """Create an enhanced embed with user information and dynamic coloring
@@ -70,21 +103,14 @@ class DiscordNotificationProvider(NotificationProvider):
             server_id: Optional server ID (required if voice_channel_id is provided)
         """
         # Get color based on action type, with fallback to auto-inference
-        if action_type:
-            color = ColorConfig.get_color(action_type)
-        else:
-            color = ColorConfig.get_color(infer_action_type(message))
-
-        # Validate color and provide fallback if invalid
-        if not ColorConfig.validate_color(color):
-            logger.warning(f"Invalid color value {color} for action type {action_type}, using default")
-            color = ColorConfig.get_color("default")
+        color = ColorConfig.get_color(action_type or infer_action_type(message))
 
         embed = discord.Embed(
             description=message,
             color=color,
-            timestamp=discord.utils.utcnow()
+            timestamp=utcnow()
         )
+        add_field = embed.add_field
 
         if user_context:
             # Set author with user info
@@ -99,7 +125,7 @@ class DiscordNotificationProvider(NotificationProvider):
                 embed.set_author(name=author_name)
 
             # Add user information fields
-            embed.add_field(
+            add_field(
                 name="User ID",
                 value=f"`{user_context.user_id}`",
                 inline=True
@@ -107,17 +133,15 @@ class DiscordNotificationProvider(NotificationProvider):
 
             if user_context.joined_at:
                 join_date = user_context.get_joined_date_formatted()
-                embed.add_field(
+                add_field(
                     name="Member Since",
                     value=join_date,
                     inline=True
                 )
 
             if user_context.roles and len(user_context.roles) > 0:
-                roles_text = ", ".join(user_context.roles[:5])  # Limit to first 5 roles
-                if len(user_context.roles) > 5:
-                    roles_text += f" (+{len(user_context.roles) - 5} more)"
-                embed.add_field(
+                roles_text = user_context.get_roles_text(5)  # Limit to first 5 roles
+                add_field(
                     name="Roles",
                     value=roles_text,
                     inline=False
@@ -126,15 +150,15 @@ class DiscordNotificationProvider(NotificationProvider):
         # Add voice channel link if provided
         if voice_channel_id and server_id:
             voice_channel_url = create_voice_channel_url(server_id, voice_channel_id)
-            embed.add_field(
+            add_field(
                 name="🎙️ Voice Channel",
                 value=f"[Join Voice Channel]({voice_channel_url})",
                 inline=False
             )
         elif voice_channel_id and not server_id:
             # Log warning but still include channel ID in case server_id was accidentally omitted
-            logger.warning(f"Voice channel ID provided ({voice_channel_id}) but server_id missing for enhanced message")
-            embed.add_field(
+            logger.warning("Voice channel ID provided (%s) but server_id missing for enhanced message", voice_channel_id)
+            add_field(
                 name="🎙️ Voice Channel ID",
                 value=f"`{voice_channel_id}`",
                 inline=False
@@ -142,39 +166,152 @@ class DiscordNotificationProvider(NotificationProvider):
 
         return embed
 
-    async def send_notification(self, user_id: str, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> bool:
-        """Send notification to Discord user
+    async def _get_user(self, discord_user_id: int) -> Optional[discord.User]:
+        """Get a Discord user from the gateway cache, our cache, or the REST API"""
+        user = self.client.get_user(discord_user_id) or self._user_cache.get(discord_user_id)
+        if user:
+            return user
+
+        pending = self._pending_fetches.get(discord_user_id)
+        if pending is not None:
+            return await pending
+
+        pending = asyncio.ensure_future(self.client.fetch_user(discord_user_id))
+        self._pending_fetches[discord_user_id] = pending
+        try:
+            user = await pending
+        finally:
+            del self._pending_fetches[discord_user_id]
+
+        if user:
+            self._user_cache[discord_user_id] = user
+        return user
+
+    async def _get_dm_channel(self, discord_user_id: int) -> Optional[discord.DMChannel]:
+        """Get the DM channel for a user, opening and caching it on first use"""
+        dm = self._dm_channels.get(discord_user_id)
+        if dm is not None:
+            return dm
+
+        user = await self._get_user(discord_user_id)
+        if not user:
+            return None
+
+        dm = user.dm_channel or await user.create_dm()
+        self._dm_channels[discord_user_id] = dm
+        return dm
+
+    async def prewarm(self, user_ids: Iterable[Union[int, str]]) -> None:
+        """Open DM channels for known recipients before their first notification
+
+        Args:
+            user_ids: Discord user IDs that notifications will be sent to
+        """
+        async def open_dm(user_id: Union[int, str]) -> None:
+            try:
+                async with self._send_semaphore:
+                    await self._get_dm_channel(user_id if isinstance(user_id, int) else int(user_id))
+            except Exception as e:
+                logger.warning("Could not open Discord DM channel for user %s: %s", user_id, e)
+
+        await asyncio.gather(*(open_dm(user_id) for user_id in set(user_ids)))
+
+    def build_payload(self, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> FormattedMessage:
+        """Format a notification once so it can be delivered to several users
 
         Args:
-            user_id: Discord user ID as string
             message: The notification message
             user_context: Optional user context for enhanced formatting
             action_type: Optional action type for color coding
             voice_channel_id: Optional voice channel ID to create clickable link
             server_id: Optional server ID (required if voice_channel_id is provided)
         """
+        return self._format_for_discord(message, user_context, action_type, voice_channel_id, server_id)
+
+    async def deliver(self, user_id: Union[int, str], payload: FormattedMessage) -> bool:
+        """Send a payload from build_payload to a Discord user
+
+        Rate limits, Discord server errors and dropped connections are retried
+        with exponential backoff; any other error is logged and reported as
+        False.
+
+        Args:
+            user_id: Discord user ID, as an int or a string
+            payload: The formatted message to send
+        """
+        # Discord uses integer IDs; stored preferences hold them as strings
         try:
-            # Convert string user_id to int since Discord uses integers for IDs
-            discord_user_id = int(user_id)
-            user = await self.client.fetch_user(discord_user_id)
+            discord_user_id = user_id if isinstance(user_id, int) else int(user_id)
+        except (TypeError, ValueError):
+            logger.error("Invalid Discord user ID %r", user_id)
+            return False
+        # Chunks already delivered, so a retry resumes instead of repeating them
+        sent = 0
+
+        for attempt in range(SEND_RETRIES + 1):
+            try:
+                async with self._send_semaphore:
+                    dm = await self._get_dm_channel(discord_user_id)
+
+                    if dm is None:
+                        logger.warning("Could not find Discord user with ID %s", user_id)
+                        return False
 
-            if not user:
-                logger.warning(f"Could not find Discord user with ID {user_id}")
+                    # Send as embed when available
+                    if payload.embed is not None:
+                        await dm.send(embed=payload.embed)
+                    else:
+                        # Chunks are parts of one message, so keep them in order
+                        for chunk in payload.chunks[sent:]:
+                            await dm.send(chunk)
+                            sent += 1
+
+                logger.info("Sent Discord DM to user %s", user_id)
+                return True
+
+            except discord.Forbidden as e:
+                # DMs closed or the bot is blocked; retrying won't help
+                logger.warning("Discord user %s does not accept DMs: %s", user_id, e)
                 return False
 
-            formatted = self._format_for_discord(message, user_context, action_type, voice_channel_id, server_id)
+            except discord.HTTPException as e:
+                # Only rate limits and Discord server errors are worth retrying
+                retriable = e.status == 429 or e.status >= 500
+                if not retriable or attempt == SEND_RETRIES:
+                    logger.error("Failed to send Discord DM to user %s: %s", user_id, e)
+                    return False
+                reason = f"status {e.status}"
 
-            # Send as embed when available
-            if "embed" in formatted and formatted["embed"] is not None:
-                await user.send(embed=formatted["embed"])
-            else:
-                # Send any chunks sequentially
-                for chunk in formatted.get("chunks", [message]):
-                    await user.send(chunk)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Connection resets and timeouts are as transient as a 5xx
+                if attempt == SEND_RETRIES:
+                    logger.error("Failed to send Discord DM to user %s: %s", user_id, e)
+                    return False
+                reason = type(e).__name__
+
+            except Exception as e:
+                logger.error("Unexpected error sending Discord DM to user %s: %s", user_id, e)
+                return False
 
-            logger.info(f"Sent Discord DM to user {user_id}")
-            return True
+            delay = SEND_RETRY_DELAY * 2 ** attempt
+            logger.warning("Discord DM to user %s failed (%s), retrying in %.1fs", user_id, reason, delay)
+            await asyncio.sleep(delay)
 
+    async def send_notification(self, user_id: Union[int, str], message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> bool:
+        """Send notification to Discord user
+
+        Args:
+            user_id: Discord user ID, as an int or a string
+            message: The notification message
+            user_context: Optional user context for enhanced formatting
+            action_type: Optional action type for color coding
+            voice_channel_id: Optional voice channel ID to create clickable link
+            server_id: Optional server ID (required if voice_channel_id is provided)
+        """
+        try:
+            payload = self.build_payload(message, user_context, action_type, voice_channel_id, server_id)
         except Exception as e:
-            logger.error(f"Failed to send Discord DM to user {user_id}: {str(e)}")
+            logger.error("Failed to send Discord DM to user %s: %s", user_id, e)
             return False
+
+        return await self.deliver(user_id, payload)
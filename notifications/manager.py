@@ -2,33 +2,46 @@ from typing import Dict, List, Optional
 from .base import NotificationProvider, UserContext
 from .discord_provider import DiscordNotificationProvider
 from .telegram_provider import TelegramNotificationProvider
+from .cache import TTLCache
+import asyncio
 import logging
 
 logger = logging.getLogger("discord_bot")
 
+# Identical notifications to the same recipient within this window are sent once
+NOTIFICATION_COALESCE_SECONDS = 0.2
+
 class NotificationManager:
     def __init__(self):
         self.providers: Dict[str, NotificationProvider] = {}
-        
+        # Recent sends keyed by recipient and content, so bursts of the same
+        # event share one delivery
+        self._recent_sends = TTLCache(maxsize=4096, ttl=NOTIFICATION_COALESCE_SECONDS)
+
     def register_provider(self, name: str, provider: NotificationProvider):
         """Register a new notification provider"""
         self.providers[name] = provider
-        logger.info(f"Registered notification provider: {name}")
+        logger.info("Registered notification provider: %s", name)
         
+    async def _initialize_provider(self, name: str, provider: NotificationProvider):
+        """Initialize a single provider, logging any failure"""
+        try:
+            await provider.initialize()
+            logger.info("Initialized notification provider: %s", name)
+        except Exception as e:
+            logger.error("Failed to initialize provider %s: %s", name, e)
+
     async def initialize_providers(self):
-        """Initialize all registered providers"""
-        for name, provider in self.providers.items():
-            try:
-                await provider.initialize()
-                logger.info(f"Initialized notification provider: {name}")
-            except Exception as e:
-                logger.error(f"Failed to initialize provider {name}: {str(e)}")
+        """Initialize all registered providers concurrently"""
+        await asyncio.gather(
+            *(self._initialize_provider(name, provider) for name, provider in self.providers.items())
+        )
                 
     async def send_notification(self, provider_name: str, user_id: str, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> bool:
         """Send a notification using a specific provider"""
         provider = self.providers.get(provider_name)
         if not provider:
-            logger.error(f"No provider found with name: {provider_name}")
+            logger.error("No provider found with name: %s", provider_name)
             return False
 
         return await provider.send_notification(user_id, message, user_context, action_type, voice_channel_id, server_id)
@@ -47,9 +60,81 @@ class NotificationManager:
         Returns:
             Dict mapping provider names to success status
         """
+        # Send through all providers concurrently so one slow provider doesn't delay the rest
+        provider_names = list(user_notifications)
+        outcomes = await asyncio.gather(
+            *(
+                self.send_notification(provider_name, user_id, message, user_context, action_type, voice_channel_id, server_id)
+                for provider_name, user_id in user_notifications.items()
+            ),
+            return_exceptions=True,
+        )
+
         results = {}
-        for provider_name, user_id in user_notifications.items():
-            results[provider_name] = await self.send_notification(provider_name, user_id, message, user_context, action_type, voice_channel_id, server_id)
+        for provider_name, outcome in zip(provider_names, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error("Failed to send notification via %s: %s", provider_name, outcome)
+                outcome = False
+            results[provider_name] = outcome
+        return results
+
+    async def send_notification_to_many(self, recipients: List[Dict[str, str]], message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> List[Dict[str, bool]]:
+        """Send the same notification to several users through their providers
+
+        Providers that expose build_payload/deliver format the message once
+        and reuse the payload for every recipient. A notification identical
+        to one sent to the same recipient within NOTIFICATION_COALESCE_SECONDS
+        is not sent again; it reports the result of the earlier send.
+
+        Args:
+            recipients: One dict per user, mapping provider names to user IDs
+            message: The message to send
+            user_context: User context information for enhanced formatting
+            action_type: The type of action that triggered this notification
+            voice_channel_id: Optional voice channel ID for Discord voice channel links
+            server_id: Optional server ID (required if voice_channel_id is provided)
+
+        Returns:
+            One dict per recipient mapping provider names to success status
+        """
+        payloads = {}
+        for user_notifications in recipients:
+            for provider_name in user_notifications:
+                provider = self.providers.get(provider_name)
+                if provider_name not in payloads and hasattr(provider, "build_payload"):
+                    try:
+                        payloads[provider_name] = provider.build_payload(message, user_context, action_type, voice_channel_id, server_id)
+                    except Exception as e:
+                        logger.error("Failed to format notification for %s: %s", provider_name, e)
+                        payloads[provider_name] = None
+
+        async def deliver_one(provider_name: str, user_id: str) -> bool:
+            if provider_name in payloads:
+                payload = payloads[provider_name]
+                return payload is not None and await self.providers[provider_name].deliver(user_id, payload)
+            return await self.send_notification(provider_name, user_id, message, user_context, action_type, voice_channel_id, server_id)
+
+        async def send_one(provider_name: str, user_id: str) -> bool:
+            key = (provider_name, user_id, message, action_type, voice_channel_id)
+            pending = self._recent_sends.get(key)
+            if pending is None:
+                pending = asyncio.ensure_future(deliver_one(provider_name, user_id))
+                self._recent_sends[key] = pending
+            return await pending
+
+        sends = [
+            (index, provider_name, send_one(provider_name, user_id))
+            for index, user_notifications in enumerate(recipients)
+            for provider_name, user_id in user_notifications.items()
+        ]
+        outcomes = await asyncio.gather(*(send for _, _, send in sends), return_exceptions=True)
+
+        results: List[Dict[str, bool]] = [{} for _ in recipients]
+        for (index, provider_name, _), outcome in zip(sends, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error("Failed to send notification via %s: %s", provider_name, outcome)
+                outcome = False
+            results[index][provider_name] = outcome
         return results
 
     async def cleanup_provider_cache(self, provider_name: str) -> Optional[Dict[str, int]]:
@@ -62,7 +147,8 @@ class NotificationManager:
 
     async def cleanup_all_provider_caches(self) -> Dict[str, Optional[Dict[str, int]]]:
         """Clean up caches for all providers"""
-        results = {}
-        for provider_name in self.providers.keys():
-            results[provider_name] = await self.cleanup_provider_cache(provider_name)
-        return results
+        provider_names = list(self.providers)
+        outcomes = await asyncio.gather(
+            *(self.cleanup_provider_cache(provider_name) for provider_name in provider_names)
+        )
+        return dict(zip(provider_names, outcomes))
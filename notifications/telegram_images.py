@@ -6,31 +6,63 @@ with thumbnails for efficient notification delivery.
 """
 import asyncio
 import hashlib
+import heapq
 import io
 import os
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict, Any
-import aiofiles
+from typing import Optional, Dict, Any, List, Tuple
 import httpx
-from PIL import Image
+from pymongo import UpdateOne
+from PIL import Image, ImageOps, __version__ as PILLOW_VERSION
 from telegram.error import TelegramError
 from telegram import Bot
 
 from .config import TelegramThumbnailConfig
+from .cache import TTLCache
 import logging
 
 logger = logging.getLogger("discord_bot")
 
+# Thumbnails kept in memory in front of the disk cache (~20KB each)
+MEMORY_CACHE_SIZE = 1000
+
+# Largest avatar download accepted; Telegram profile photos are far smaller
+MAX_AVATAR_BYTES = 5 * 1024 * 1024
+
+# Delay before queued thumbnail metadata is written in one batch
+METADATA_FLUSH_SECONDS = 0.1
+
+# HTTP/2 lets concurrent avatar downloads share one connection; it needs the
+# optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create an HTTP client for Telegram file downloads with pooled keep-alive connections"""
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=TelegramThumbnailConfig.get_api_timeout(),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    )
+
 
 class ImageProcessor:
     """Handles image processing operations for Telegram profile pictures"""
 
     @staticmethod
     def calculate_image_hash(image_data: bytes) -> str:
-        """Calculate SHA-256 hash for image content to detect changes"""
-        return hashlib.sha256(image_data).hexdigest()
+        """Calculate a content hash for an image to detect changes
+
+        This is only an identifier, not a security check, so a 16-byte
+        BLAKE2b digest is used; it is faster than SHA-256 in software.
+        """
+        return hashlib.blake2b(image_data, digest_size=16).hexdigest()
 
     @staticmethod
     def create_thumbnail(image_data: bytes, width: int, height: int, quality: int = 85) -> bytes:
@@ -53,6 +85,11 @@ class ImageProcessor:
         try:
             # Open image with PIL
             image = Image.open(io.BytesIO(image_data))
+            # Let the JPEG decoder scale down by 1/2-1/8 while decoding; keeping
+            # twice the target size leaves the Lanczos pass enough detail
+            image.draft('RGB', (width * 2, height * 2))
+            # Decode now so corrupt or truncated data fails here
+            image.load()
 
             # Convert to RGB if necessary (for RGBA/P images)
             if image.mode in ('RGBA', 'P'):
@@ -67,34 +104,20 @@ class ImageProcessor:
             if image.mode != 'RGB':
                 image = image.convert('RGB')
 
-            # Create thumbnail with aspect ratio preserved
-            image.thumbnail((width, height), Image.Resampling.LANCZOS)
-
-            # Create new image with exact dimensions to ensure consistency
-            new_image = Image.new('RGB', (width, height), (255, 255, 255))
-            x = (width - image.width) // 2
-            y = (height - image.height) // 2
-            new_image.paste(image, (x, y))
+            # Center-crop to the target aspect ratio and scale to the exact
+            # dimensions in a single resize pass
+            new_image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
 
-            # Save to bytes
+            # Save to bytes; optimize=True would add a second Huffman pass that
+            # roughly doubles encode time for a few percent on small thumbnails
             output = io.BytesIO()
-            new_image.save(output, format='JPEG', quality=quality, optimize=True)
+            new_image.save(output, format='JPEG', quality=quality)
             return output.getvalue()
 
         except Exception as e:
             logger.error(f"Failed to create thumbnail: {str(e)}")
             raise
 
-    @staticmethod
-    def validate_image_data(image_data: bytes) -> bool:
-        """Validate that the data is a readable image format"""
-        try:
-            image = Image.open(io.BytesIO(image_data))
-            image.verify()  # Verify the image is not corrupted
-            return True
-        except Exception:
-            return False
-
 
 class CacheManager:
     """Manages cached thumbnails with expiration and cleanup"""
@@ -109,6 +132,22 @@ class CacheManager:
         self.db_collection = db_collection
         self.cache_dir = Path(TelegramThumbnailConfig.get_cache_dir())
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Recently used thumbnails by cache key, so repeat notifications
+        # skip the disk read and the metadata lookup
+        self._memory_cache = TTLCache(
+            maxsize=MEMORY_CACHE_SIZE,
+            ttl=TelegramThumbnailConfig.get_cache_ttl_hours() * 3600,
+        )
+        # (modification time, size) of every cached file by cache key, read
+        # from disk on the first cleanup and kept current as files change
+        self._entries: Optional[Dict[str, Tuple[float, int]]] = None
+        self._total_size = 0
+        # Min-heap of (modification time, cache key), oldest first. Entries
+        # whose file was replaced or removed are skipped when popped.
+        self._age_heap: List[Tuple[float, str]] = []
+        # Metadata upserts waiting to be written together
+        self._pending_metadata: List[UpdateOne] = []
+        self._metadata_flush: Optional[asyncio.Task] = None
 
     def _get_cache_key(self, user_id: str, image_hash: str) -> str:
         """Generate cache key for a user and image hash"""
@@ -118,19 +157,72 @@ class CacheManager:
         """Get filesystem path for cached image"""
         return self.cache_dir / f"{cache_key}.jpg"
 
+    @property
+    def total_size(self) -> int:
+        """Total bytes of cached thumbnails, known once the first cleanup has run"""
+        return self._total_size
+
+    def _track_file(self, cache_key: str, size: int) -> None:
+        """Record a newly written cache file in the cleanup index"""
+        if self._entries is None:
+            return
+        self._forget_file(cache_key)
+        mtime = time.time()
+        self._entries[cache_key] = (mtime, size)
+        self._total_size += size
+        heapq.heappush(self._age_heap, (mtime, cache_key))
+
+    def _forget_file(self, cache_key: str) -> None:
+        """Drop a cache file from the memory cache and the cleanup index"""
+        self._memory_cache.pop(cache_key)
+        if self._entries is None:
+            return
+        entry = self._entries.pop(cache_key, None)
+        if entry:
+            self._total_size -= entry[1]
+
+    def _peek_oldest(self) -> Optional[Tuple[float, str]]:
+        """Return the oldest live (modification time, cache key), dropping stale heap entries"""
+        while self._age_heap:
+            mtime, cache_key = self._age_heap[0]
+            entry = self._entries.get(cache_key)
+            if entry and entry[0] == mtime:
+                return mtime, cache_key
+            heapq.heappop(self._age_heap)
+        return None
+
+    def _rebuild_age_heap(self) -> None:
+        """Rebuild the age heap from the index, dropping stale entries"""
+        self._age_heap = [(mtime, cache_key) for cache_key, (mtime, _) in self._entries.items()]
+        heapq.heapify(self._age_heap)
+
+    def _scan_cache_dir(self) -> Dict[str, Tuple[float, int]]:
+        """Stat every cached file once; runs in a worker thread"""
+        entries = {}
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".jpg") and entry.is_file():
+                    stat = entry.stat()
+                    entries[entry.name[:-4]] = (stat.st_mtime, stat.st_size)
+        return entries
+
     async def get_cached_thumbnail(self, user_id: str, image_hash: str) -> Optional[bytes]:
         """
         Retrieve cached thumbnail if it exists and is valid
 
         Args:
             user_id: Telegram user ID
-            image_hash: SHA-256 hash of the original image
+            image_hash: Identifier of the original image (Telegram file_unique_id)
 
         Returns:
             Thumbnail bytes if cached and valid, None otherwise
         """
         try:
             cache_key = self._get_cache_key(user_id, image_hash)
+            thumbnail_data = self._memory_cache.get(cache_key)
+            if thumbnail_data is not None:
+                return thumbnail_data
+
             cache_path = self._get_cache_path(cache_key)
 
             # Check if file exists
@@ -138,7 +230,7 @@ class CacheManager:
                 return None
 
             # Check expiration from database if available
-            if self.db_collection:
+            if self.db_collection is not None:
                 metadata = await self.db_collection.find_one(
                     {"user_id": user_id, "image_hash": image_hash}
                 )
@@ -154,11 +246,13 @@ class CacheManager:
                 file_age_hours = (time.time() - cache_path.stat().st_mtime) / 3600
                 if file_age_hours > TelegramThumbnailConfig.get_cache_ttl_hours():
                     cache_path.unlink(missing_ok=True)
+                    self._forget_file(cache_key)
                     return None
 
             # Read cached thumbnail
-            async with aiofiles.open(cache_path, 'rb') as f:
-                return await f.read()
+            thumbnail_data = await asyncio.to_thread(cache_path.read_bytes)
+            self._memory_cache[cache_key] = thumbnail_data
+            return thumbnail_data
 
         except Exception as e:
             logger.error(f"Failed to retrieve cached thumbnail for user {user_id}: {str(e)}")
@@ -170,7 +264,7 @@ class CacheManager:
 
         Args:
             user_id: Telegram user ID
-            image_hash: SHA-256 hash of the original image
+            image_hash: Identifier of the original image (Telegram file_unique_id)
             thumbnail_data: Processed thumbnail bytes
 
         Returns:
@@ -181,12 +275,14 @@ class CacheManager:
             cache_path = self._get_cache_path(cache_key)
 
             # Write thumbnail to file
-            async with aiofiles.open(cache_path, 'wb') as f:
-                await f.write(thumbnail_data)
-
-            # Save metadata to database if available
-            if self.db_collection:
-                await self.db_collection.update_one(
+            await asyncio.to_thread(cache_path.write_bytes, thumbnail_data)
+            self._track_file(cache_key, len(thumbnail_data))
+            self._memory_cache[cache_key] = thumbnail_data
+
+            # Queue metadata for the database if available; the file on disk
+            # is what serves the cache, so this doesn't need to block the send
+            if self.db_collection is not None:
+                self._queue_metadata(UpdateOne(
                     {"user_id": user_id, "image_hash": image_hash},
                     {
                         "$set": {
@@ -197,7 +293,7 @@ class CacheManager:
                         }
                     },
                     upsert=True
-                )
+                ))
 
             return True
 
@@ -205,18 +301,41 @@ class CacheManager:
             logger.error(f"Failed to save thumbnail for user {user_id}: {str(e)}")
             return False
 
+    def _queue_metadata(self, operation: UpdateOne) -> None:
+        """Queue a metadata write, starting a delayed flush if none is pending"""
+        self._pending_metadata.append(operation)
+        if self._metadata_flush is None:
+            self._metadata_flush = asyncio.create_task(self._flush_metadata())
+
+    async def _flush_metadata(self) -> None:
+        """Write queued metadata in one bulk_write after METADATA_FLUSH_SECONDS"""
+        await asyncio.sleep(METADATA_FLUSH_SECONDS)
+        operations, self._pending_metadata = self._pending_metadata, []
+        self._metadata_flush = None
+
+        try:
+            await self.db_collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to save thumbnail metadata for {len(operations)} thumbnails: {str(e)}")
+
+    async def close(self) -> None:
+        """Wait for metadata still queued to be written"""
+        if self._metadata_flush is not None:
+            await self._metadata_flush
+
     async def _remove_from_cache(self, user_id: str, image_hash: str) -> bool:
         """Remove thumbnail from cache"""
         try:
             cache_key = self._get_cache_key(user_id, image_hash)
             cache_path = self._get_cache_path(cache_key)
+            self._forget_file(cache_key)
 
             # Remove file
             if cache_path.exists():
                 cache_path.unlink()
 
             # Remove metadata from database
-            if self.db_collection:
+            if self.db_collection is not None:
                 await self.db_collection.delete_one(
                     {"user_id": user_id, "image_hash": image_hash}
                 )
@@ -240,35 +359,36 @@ class CacheManager:
             ttl_hours = TelegramThumbnailConfig.get_cache_ttl_hours()
             max_size_mb = TelegramThumbnailConfig.get_cache_max_size_mb()
 
-            # Get all cache files
-            if self.cache_dir.exists():
-                cache_files = list(self.cache_dir.glob("*.jpg"))
-            else:
-                return stats
-
-            # Sort by modification time (oldest first)
-            cache_files.sort(key=lambda f: f.stat().st_mtime)
-
-            # Remove expired files
+            # Stat the directory once; afterwards the index is kept current
+            # by save/remove, so cleanups don't touch files they keep
+            if self._entries is None:
+                if not self.cache_dir.exists():
+                    return stats
+                self._entries = await asyncio.to_thread(self._scan_cache_dir)
+                self._total_size = sum(size for _, size in self._entries.values())
+                self._rebuild_age_heap()
+            elif len(self._age_heap) > 2 * len(self._entries):
+                # Mostly stale entries from replaced files, compact it
+                self._rebuild_age_heap()
+
+            # Pop files oldest first: expired ones, then any more needed to
+            # get under the size limit. Work is proportional to removals.
             cutoff_time = time.time() - (ttl_hours * 3600)
-            for cache_file in cache_files:
-                if cache_file.stat().st_mtime < cutoff_time:
-                    cache_file.unlink(missing_ok=True)
-                    stats["expired_removed"] += 1
-
-            # Check total size and remove oldest files if needed
-            total_size = sum(f.stat().st_size for f in self.cache_dir.glob("*.jpg"))
             max_size_bytes = max_size_mb * 1024 * 1024
-
-            while total_size > max_size_bytes and cache_files:
-                oldest_file = cache_files.pop(0)
-                if oldest_file.exists():
-                    total_size -= oldest_file.stat().st_size
-                    oldest_file.unlink(missing_ok=True)
+            while (oldest := self._peek_oldest()) is not None:
+                mtime, cache_key = oldest
+                if mtime >= cutoff_time and self._total_size <= max_size_bytes:
+                    break
+                heapq.heappop(self._age_heap)
+                self._get_cache_path(cache_key).unlink(missing_ok=True)
+                self._forget_file(cache_key)
+                if mtime < cutoff_time:
+                    stats["expired_removed"] += 1
+                else:
                     stats["size_limit_removed"] += 1
 
             # Clean up database metadata for removed files if available
-            if self.db_collection and (stats["expired_removed"] > 0 or stats["size_limit_removed"] > 0):
+            if self.db_collection is not None and (stats["expired_removed"] > 0 or stats["size_limit_removed"] > 0):
                 await self._cleanup_orphaned_metadata()
 
         except Exception as e:
@@ -279,7 +399,7 @@ class CacheManager:
     async def _cleanup_orphaned_metadata(self):
         """Remove database metadata for files that no longer exist"""
         try:
-            if not self.db_collection:
+            if self.db_collection is None:
                 return
 
             # Find all metadata entries
@@ -305,7 +425,7 @@ class TelegramProfilePictureManager:
         """
         self.bot = bot
         self.cache_manager = CacheManager(db_collection)
-        self.http_client = httpx.AsyncClient(timeout=TelegramThumbnailConfig.get_api_timeout())
+        self.http_client = create_http_client()
 
     async def get_thumbnail_for_user(self, user_id: str) -> Optional[bytes]:
         """
@@ -328,6 +448,13 @@ class TelegramProfilePictureManager:
             # Get the largest available photo
             photo = profile_photos.photos[0][-1]  # Last item is largest
 
+            # file_unique_id is stable for the same image, so a cache hit
+            # skips the file lookup and the download entirely
+            image_hash = photo.file_unique_id
+            cached_thumbnail = await self.cache_manager.get_cached_thumbnail(user_id, image_hash)
+            if cached_thumbnail:
+                return cached_thumbnail
+
             # Get file information
             file_info = await self.bot.get_file(file_id=photo.file_id)
             file_url = file_info.file_path
@@ -336,26 +463,25 @@ class TelegramProfilePictureManager:
             if not file_url.startswith('http'):
                 file_url = f"https://api.telegram.org/file/bot{self.bot.token.split(':')[0]}/{file_url}"
 
-            # Download the image
-            response = await self.http_client.get(file_url)
-            response.raise_for_status()
-            image_data = response.content
-
-            # Validate image data
-            if not ImageProcessor.validate_image_data(image_data):
-                logger.error(f"Invalid image data for user {user_id}")
+            # Download the image, refusing anything implausibly large for an avatar
+            if file_info.file_size and file_info.file_size > MAX_AVATAR_BYTES:
+                logger.error(f"Profile picture for user {user_id} is too large ({file_info.file_size} bytes)")
                 return None
 
-            # Calculate hash for cache lookup
-            image_hash = ImageProcessor.calculate_image_hash(image_data)
-
-            # Check cache
-            cached_thumbnail = await self.cache_manager.get_cached_thumbnail(user_id, image_hash)
-            if cached_thumbnail:
-                return cached_thumbnail
+            image_data = bytearray()
+            async with self.http_client.stream("GET", file_url) as response:
+                response.raise_for_status()
+                async for data in response.aiter_bytes(65536):
+                    image_data += data
+                    if len(image_data) > MAX_AVATAR_BYTES:
+                        logger.error(f"Profile picture for user {user_id} exceeds {MAX_AVATAR_BYTES} bytes")
+                        return None
+            image_data = bytes(image_data)
 
-            # Generate new thumbnail
-            thumbnail_data = ImageProcessor.create_thumbnail(
+            # Generate new thumbnail in a worker thread; Pillow releases the GIL
+            # while decoding, resizing and encoding, so the event loop stays free
+            thumbnail_data = await asyncio.to_thread(
+                ImageProcessor.create_thumbnail,
                 image_data,
                 width=TelegramThumbnailConfig.get_width(),
                 height=TelegramThumbnailConfig.get_height(),
@@ -387,6 +513,7 @@ class TelegramProfilePictureManager:
 
     async def close(self):
         """Clean up resources"""
+        await self.cache_manager.close()
         await self.http_client.aclose()
 
     async def get_configuration_report(self) -> dict:
@@ -394,20 +521,13 @@ class TelegramProfilePictureManager:
         from .config import TelegramThumbnailConfig
 
         cache_stats = await self.cache_manager.cleanup_cache()
-        cache_dir_size = 0
-
-        try:
-            cache_path = Path(TelegramThumbnailConfig.get_cache_dir())
-            if cache_path.exists():
-                # Get total size of all jpg files in cache
-                for jpg_file in cache_path.glob("*.jpg"):
-                    cache_dir_size += jpg_file.stat().st_size
-                cache_dir_size = cache_dir_size / (1024 * 1024)  # Convert to MB
-        except Exception:
-            pass
+        # Cleanup keeps a running total, so the directory isn't walked again
+        cache_dir_size = self.cache_manager.total_size / (1024 * 1024)  # Convert to MB
 
         return {
             "configuration": TelegramThumbnailConfig.get_config_report(),
+            # Pillow-SIMD builds report a ".postN" version
+            "pillow_version": PILLOW_VERSION,
             "cache_stats": {
                 "current_size_mb": round(cache_dir_size, 2),
                 "max_size_mb": TelegramThumbnailConfig.get_cache_max_size_mb(),
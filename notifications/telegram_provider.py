@@ -1,31 +1,161 @@
 import os
 import html
+import re
 from .base import NotificationProvider, UserContext
 import logging
-from telegram.ext import ApplicationBuilder
-from telegram import Bot
-from telegram.error import TelegramError
-from typing import Optional
+from io import BytesIO
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple
 
-from .telegram_images import TelegramProfilePictureManager
 from .config import TelegramThumbnailConfig
+from .cache import TTLCache
+
+# python-telegram-bot, httpx and Pillow are imported when the provider is
+# initialized, so deployments without Telegram never load them
+if TYPE_CHECKING:
+    from telegram import Bot
+    from .telegram_images import TelegramProfilePictureManager
 
 logger = logging.getLogger("discord_bot")
 
+# Connections kept open to the Bot API; read once at import
+try:
+    CONNECTION_POOL_SIZE = int(os.getenv("TELEGRAM_CONNECTION_POOL_SIZE", "16"))
+except ValueError:
+    CONNECTION_POOL_SIZE = 16
+
+# Telegram's message limit, in UTF-16 code units of the text after entity
+# parsing. Measuring the raw HTML instead only overestimates, since tags are
+# dropped and each entity becomes a single character.
+MESSAGE_LIMIT = 4096
+# Photo captions are limited to 1024, counted the same way
+CAPTION_LIMIT = 1024
+
+
+def _utf16_length(text: str) -> int:
+    """Length of text in UTF-16 code units, as Telegram counts it"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _utf16_prefix_end(text: str, limit: int) -> int:
+    """Number of leading characters of text that fit in limit UTF-16 code units"""
+    # Without characters outside the BMP, characters and code units agree
+    if _utf16_length(text[:limit]) == min(limit, len(text)):
+        return min(limit, len(text))
+    units = 0
+    for idx, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return idx
+    return len(text)
+
+
+_TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z]+)[^>]*>')
+
+
+def _find_break(text: str, end: int) -> Tuple[int, int]:
+    """Find where to split text within its first end characters
+
+    Returns (cut, skip): the chunk is text[:cut] and the next one starts at
+    cut + skip. Prefers the last newline, then the last space, and never
+    splits inside a tag or an entity.
+    """
+    # Pull the limit back to before a tag or entity the window would cut into
+    limit = end
+    tag_start = text.rfind('<', 0, end)
+    if tag_start > text.rfind('>', 0, end):
+        end = tag_start
+    entity_start = text.rfind('&', 0, end)
+    if entity_start > text.rfind(';', 0, end):
+        end = entity_start
+    if end <= 0:
+        # Nothing safe to split on; cut at the limit rather than loop forever
+        return limit, 0
+
+    for separator in ('\n', ' '):
+        cut = text.rfind(separator, 0, end)
+        if cut > 0 and text.rfind('<', 0, cut) <= text.rfind('>', 0, cut):
+            return cut, 1
+    return end, 0
+
+
+def _split_telegram_html(text: str, limit: int, first_limit: Optional[int] = None) -> List[str]:
+    """Split Telegram HTML into chunks of at most limit UTF-16 code units of content
+
+    The first chunk is held to first_limit instead when given, for a caption
+    followed by plain messages. Tags still open at a split are closed at the end of the chunk and opened
+    again at the start of the next one, so every chunk parses on its own.
+    Telegram counts message length after parsing, so these extra tags don't
+    count toward its limit.
+    """
+    chunks = []
+    reopen = ""
+    chunk_limit = first_limit or limit
+    while _utf16_length(text) > chunk_limit:
+        cut, skip = _find_break(text, _utf16_prefix_end(text, chunk_limit))
+        piece = reopen + text[:cut]
+
+        open_tags = []
+        for match in _TAG_PATTERN.finditer(piece):
+            if match.group(0).endswith('/>'):
+                continue
+            name = match.group(2).lower()
+            if not match.group(1):
+                open_tags.append((name, match.group(0)))
+            elif open_tags and open_tags[-1][0] == name:
+                open_tags.pop()
+
+        chunks.append(piece + "".join(f"</{name}>" for name, _ in reversed(open_tags)))
+        reopen = "".join(start_tag for _, start_tag in open_tags)
+        text = text[cut + skip:]
+        chunk_limit = limit
+
+    chunks.append(reopen + text)
+    return chunks
+
+
+class TelegramPayload(NamedTuple):
+    """A formatted Telegram message, reusable across recipients"""
+    text_chunks: List[str]
+    # Chunks to send with a thumbnail, the first as its caption
+    caption_chunks: Optional[List[str]]
+    # User whose profile picture to attach, if thumbnails apply
+    thumbnail_user_id: Optional[str]
+
 
 class TelegramNotificationProvider(NotificationProvider):
     def __init__(self, db_collection=None):
-        self.bot: Bot = None
-        self.profile_picture_manager: Optional[TelegramProfilePictureManager] = None
+        self.bot: Optional["Bot"] = None
+        self.profile_picture_manager: Optional["TelegramProfilePictureManager"] = None
         self.db_collection = db_collection
+        # Telegram file_id of each uploaded thumbnail by content hash, so a
+        # thumbnail is uploaded once and then referenced by ID
+        self._photo_file_ids = TTLCache(maxsize=1024, ttl=24 * 3600)
+        # User info headers by (user_id, include_profile_picture), kept with
+        # the UserContext they were built from
+        self._header_cache = TTLCache(maxsize=1024, ttl=60)
 
     async def initialize(self) -> None:
         token = os.getenv("TELEGRAM_BOT_TOKEN")
         if not token:
             raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set")
 
-        application = ApplicationBuilder().token(token).build()
-        self.bot = application.bot
+        from telegram import Bot
+        from telegram.request import HTTPXRequest
+        from .telegram_images import HTTP2_AVAILABLE, TelegramProfilePictureManager
+
+        # Only outbound messages are sent, so a bare Bot is enough; an
+        # Application would also set up an updater and job queue
+        # One long-lived connection pool keeps TLS handshakes off the send
+        # path; HTTP/2 is used when h2 is installed
+        request = HTTPXRequest(
+            connection_pool_size=CONNECTION_POOL_SIZE,
+            read_timeout=10.0,
+            http_version="2" if HTTP2_AVAILABLE else "1.1",
+        )
+        self.bot = Bot(token=token, request=request)
+        await self.bot.initialize()
 
         # Initialize profile picture manager if thumbnails are enabled
         if TelegramThumbnailConfig.is_enabled():
@@ -37,168 +167,144 @@ class TelegramNotificationProvider(NotificationProvider):
 
         logger.info("Telegram notification provider initialized")
 
-    def _format_for_telegram(self, message: str, user_context: Optional[UserContext] = None, include_profile_picture: bool = True) -> list:
+    def _format_for_telegram(self, message: str, user_context: Optional[UserContext] = None, include_profile_picture: bool = True, first_limit: int = MESSAGE_LIMIT) -> list:
         """Format message for Telegram HTML parse mode and split into safe chunks.
 
-        Telegram message limit is ~4096 characters; use a conservative limit.
-        This method preserves HTML formatting tags while sanitizing user content.
+        Telegram's message limit is 4096 UTF-16 code units (see MESSAGE_LIMIT);
+        pass first_limit=CAPTION_LIMIT when the first chunk is a photo caption.
+        User content is escaped once where it enters the message; the only tags
+        are the ones the header adds, so the result needs no further sanitizing.
         """
-        SAFE_LIMIT = 4000
-
         # Escape the original message content (user input) for safety
         escaped_message = html.escape(message, quote=False)
 
         # Enhance message with user context if available (adds HTML formatting)
-        enhanced_message = self._enhance_telegram_message(escaped_message, user_context, include_profile_picture)
+        formatted_message = self._enhance_telegram_message(escaped_message, user_context, include_profile_picture)
 
-        # Sanitize the final HTML to ensure it's valid
-        sanitized_message = self._sanitize_telegram_html(enhanced_message)
+        if _utf16_length(formatted_message) <= first_limit:
+            return [formatted_message]
 
-        # Do NOT escape the final sanitized message - preserve our HTML tags
-        if len(sanitized_message) <= SAFE_LIMIT:
-            return [sanitized_message]
-
-        chunks = []
-        idx = 0
-        while idx < len(sanitized_message):
-            chunks.append(sanitized_message[idx : idx + SAFE_LIMIT])
-            idx += SAFE_LIMIT
-        return chunks
+        # Split on line or word boundaries so no chunk breaks a tag or entity
+        return _split_telegram_html(formatted_message, MESSAGE_LIMIT, first_limit)
 
     def _enhance_telegram_message(self, message: str, user_context: Optional[UserContext], include_profile_picture: bool = True) -> str:
         """Add user information to the message for Telegram"""
         if not user_context:
             return message
 
-        # Create user info section
-        user_info_parts = []
+        # The header only depends on the user, so reuse it while the same
+        # context object is being notified about
+        key = (user_context.user_id, include_profile_picture)
+        cached = self._header_cache.get(key)
+        if cached is not None and cached[0] is user_context:
+            user_info_section = cached[1]
+        else:
+            user_info_section = self._build_user_header(user_context, include_profile_picture)
+            self._header_cache[key] = (user_context, user_info_section)
 
+        return f"{user_info_section}\n\n{message}"
+
+    def _build_user_header(self, user_context: UserContext, include_profile_picture: bool) -> str:
+        """Build the user information section shown above a Telegram message
+
+        Names and roles come from Discord users, so they are HTML-escaped here.
+        """
         # Add display name with username if available
         display_name = user_context.get_display_name()
+        username_part = ""
         if user_context.username and user_context.username != display_name:
-            user_info_parts.append(f"<b>👤 {display_name}</b> (@{user_context.username})")
-        else:
-            user_info_parts.append(f"<b>👤 {display_name}</b>")
-
-        # Add user ID
-        user_info_parts.append(f"<code>User ID: {user_context.user_id}</code>")
+            username_part = f" (@{html.escape(user_context.username, quote=False)})"
+        display_name = html.escape(display_name, quote=False)
 
         # Add joined date if available
+        joined_part = ""
         if user_context.joined_at:
-            joined_date = user_context.get_joined_date_formatted()
-            user_info_parts.append(f"📅 Joined: {joined_date}")
+            joined_part = f"\n📅 Joined: {user_context.get_joined_date_formatted()}"
 
-        # Add roles if available
-        if user_context.roles and len(user_context.roles) > 0:
-            roles_text = ", ".join(user_context.roles[:3])  # Limit to first 3 roles for Telegram
-            if len(user_context.roles) > 3:
-                roles_text += f" (+{len(user_context.roles) - 3} more)"
-            user_info_parts.append(f"🏷️ Roles: {roles_text}")
+        # Add roles if available, limited to the first 3 for Telegram
+        roles_part = ""
+        if user_context.roles:
+            roles_part = f"\n🏷️ Roles: {html.escape(user_context.get_roles_text(3), quote=False)}"
 
         # Add profile picture note if available and requested
+        avatar_part = ""
         if user_context.avatar_url and include_profile_picture:
-            user_info_parts.append(f"🖼️ Profile picture available")
-
-        # Combine user info with main message
-        user_info_section = "\n".join(user_info_parts)
-        enhanced_message = f"{user_info_section}\n\n{message}"
+            avatar_part = "\n🖼️ Profile picture available"
 
-        return enhanced_message
+        return (
+            f"<b>👤 {display_name}</b>{username_part}\n"
+            f"<code>User ID: {user_context.user_id}</code>"
+            f"{joined_part}{roles_part}{avatar_part}"
+        )
 
-    def _sanitize_telegram_html(self, html_content: str) -> str:
-        """Sanitize HTML content for Telegram to remove unsupported tags and fix common issues.
+    def build_payload(self, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> TelegramPayload:
+        """Format a notification once so it can be delivered to several chats
 
-        Telegram HTML supports: <b>, <i>, <u>, <s>, <code>, <pre>, <a>
+        Note: voice_channel_id and server_id parameters are ignored for Telegram
+        as it doesn't support clickable Discord voice channel links.
         """
-        import re
-
-        # Define supported HTML tags for Telegram
-        SUPPORTED_TAGS = {'b', 'i', 'u', 's', 'code', 'pre', 'a'}
-
-        def is_supported_tag(tag: str) -> bool:
-            """Check if a tag is supported by Telegram HTML"""
-            clean_tag = tag.lower().strip('<>/')
-            return clean_tag in SUPPORTED_TAGS
-
-        def replace_unsupported_tag(match):
-            """Replace unsupported HTML tags with plain text"""
-            full_match = match.group(0)
-            tag_content = match.group(2)
-
-            if is_supported_tag(match.group(1)):
-                # Supported tag - keep as is
-                return full_match
-            else:
-                # Unsupported tag - remove tags but keep content
-                logger.warning(f"Removing unsupported HTML tag '{match.group(1)}' in Telegram message")
-                return tag_content
-
-        # Remove unsupported tags while preserving content
-        # Pattern matches <tag>content</tag> where tag is the tag name
-        tag_pattern = r'<([^>]+)>(.*?)</\1>'
-        sanitized = re.sub(tag_pattern, replace_unsupported_tag, html_content, flags=re.DOTALL | re.IGNORECASE)
-
-        # Handle self-closing tags
-        self_closing_pattern = r'<([^>]+) */?>'
-        def replace_self_closing(match):
-            tag = match.group(1).split()[0]  # Get just the tag name, ignore attributes
-            if is_supported_tag(tag):
-                return match.group(0)  # Keep supported self-closing tags
+        text_chunks = self._format_for_telegram(message, user_context)
+
+        thumbnail_user_id = None
+        caption_chunks = None
+        if (self.profile_picture_manager and
+            TelegramThumbnailConfig.is_enabled() and
+            user_context and user_context.user_id):
+            thumbnail_user_id = user_context.user_id
+            # The caption drops the profile picture note and must fit in
+            # CAPTION_LIMIT; the text chunks are reused when they match that
+            if user_context.avatar_url:
+                caption_chunks = self._format_for_telegram(message, user_context, include_profile_picture=False, first_limit=CAPTION_LIMIT)
+            elif _utf16_length(text_chunks[0]) <= CAPTION_LIMIT:
+                caption_chunks = text_chunks
             else:
-                logger.warning(f"Removing unsupported self-closing HTML tag '{tag}' in Telegram message")
-                return ""  # Remove unsupported self-closing tags
+                caption_chunks = self._format_for_telegram(message, user_context, first_limit=CAPTION_LIMIT)
 
-        sanitized = re.sub(self_closing_pattern, replace_self_closing, sanitized)
+        return TelegramPayload(text_chunks, caption_chunks, thumbnail_user_id)
 
-        # Basic validation - ensure we don't have broken HTML structure
-        # Check for unclosed tags (simple heuristic)
-        open_count = sanitized.count('<') - sanitized.count('<a href=')  # <a> tags need special handling
-        close_count = sanitized.count('>')
-        if open_count * 2 != close_count:
-            logger.warning(f"Potential HTML structure issue detected in Telegram message: open_tags={open_count}, close_tags={close_count}")
-
-        return sanitized
-
-    async def send_notification(self, user_id: str, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> bool:
-        """Send notification to Telegram user
-
-        Note: voice_channel_id and server_id parameters are ignored for Telegram
-        as it doesn't support clickable Discord voice channel links.
-        """
+    async def deliver(self, user_id: str, payload: TelegramPayload) -> bool:
+        """Send a payload from build_payload to a Telegram chat"""
         if not self.bot:
             logger.error("Telegram bot not initialized")
             return False
 
+        # Already loaded by initialize, so these are just module lookups
+        from telegram.error import TelegramError
+        from .telegram_images import ImageProcessor
+
         try:
             # Check if we should send thumbnail
             thumbnail_sent = False
-            if (self.profile_picture_manager and
-                TelegramThumbnailConfig.is_enabled() and
-                user_context and user_context.user_id):
-
+            if payload.thumbnail_user_id:
                 # Try to get thumbnail for the user
                 try:
-                    thumbnail_data = await self.profile_picture_manager.get_thumbnail_for_user(user_context.user_id)
+                    thumbnail_data = await self.profile_picture_manager.get_thumbnail_for_user(payload.thumbnail_user_id)
 
                     if thumbnail_data:
-                        # Format message for photo caption
-                        caption_chunks = self._format_for_telegram(message, user_context, include_profile_picture=False)
-
                         # Send photo with message as caption
-                        for i, chunk in enumerate(caption_chunks):
+                        for i, chunk in enumerate(payload.caption_chunks):
                             # Use the first chunk as caption, send others as separate messages
                             if i == 0:
-                                # Convert bytes to BytesIO for Telegram API
-                                from io import BytesIO
-                                photo_stream = BytesIO(thumbnail_data)
-                                photo_stream.name = "profile_thumb.jpg"
-
-                                await self.bot.send_photo(
-                                    chat_id=user_id,
-                                    photo=photo_stream,
-                                    caption=chunk,
-                                    parse_mode="HTML"
-                                )
+                                thumbnail_hash = ImageProcessor.calculate_image_hash(thumbnail_data)
+                                photo = self._photo_file_ids.get(thumbnail_hash)
+                                if photo is None:
+                                    # Convert bytes to BytesIO for Telegram API
+                                    photo = BytesIO(thumbnail_data)
+                                    photo.name = "profile_thumb.jpg"
+
+                                try:
+                                    sent = await self.bot.send_photo(
+                                        chat_id=user_id,
+                                        photo=photo,
+                                        caption=chunk,
+                                        parse_mode="HTML"
+                                    )
+                                except TelegramError:
+                                    # A stale file_id shouldn't keep failing
+                                    self._photo_file_ids.pop(thumbnail_hash)
+                                    raise
+                                if sent.photo:
+                                    self._photo_file_ids[thumbnail_hash] = sent.photo[-1].file_id
                                 thumbnail_sent = True
                             else:
                                 # Send remaining chunks as text messages
@@ -212,8 +318,7 @@ class TelegramNotificationProvider(NotificationProvider):
                     logger.warning(f"Failed to send thumbnail for user {user_id}: {str(e)}, falling back to text")
 
             # Fallback to text-only message
-            chunks = self._format_for_telegram(message, user_context)
-            for chunk in chunks:
+            for chunk in payload.text_chunks:
                 await self.bot.send_message(chat_id=user_id, text=chunk, parse_mode="HTML")
 
             logger.info(f"Sent Telegram text notification to user {user_id}")
@@ -222,3 +327,11 @@ class TelegramNotificationProvider(NotificationProvider):
         except TelegramError as e:
             logger.error(f"Failed to send Telegram message to user {user_id}: {str(e)}")
             return False
+
+    async def send_notification(self, user_id: str, message: str, user_context: Optional[UserContext] = None, action_type: Optional[str] = None, voice_channel_id: Optional[int] = None, server_id: Optional[int] = None) -> bool:
+        """Send notification to Telegram user
+
+        Note: voice_channel_id and server_id parameters are ignored for Telegram
+        as it doesn't support clickable Discord voice channel links.
+        """
+        return await self.deliver(user_id, self.build_payload(message, user_context, action_type, voice_channel_id, server_id))